@@ -1,8 +1,12 @@
+import logging
 from modules.datafetcher.ui import fetch_prompts_ui
 import streamlit as st
 from modules.db_utils import init_db
 from modules.llmchat.ui import chat_interface
 
+# Debug output from the modules is hidden unless the level is lowered
+logging.basicConfig(level=logging.INFO)
+
 def main():
     st.set_page_config(layout="wide")
     # Initialize the database
@@ -1,13 +1,34 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 from dotenv import load_dotenv
-from modules.db_utils import save_cursor, load_cursor, clear_cursor
+from modules.db_utils import load_cursor
 
 # Load environment variables
 load_dotenv()
 
+# Pages are chained by nextCursor, so they can only be requested one after another
+PAGE_SIZE = 200  # Max allowed by the images API
+PREFETCH_PAGES = 2  # Pages the fetch thread may download ahead of processing
+
+# Reuse keep-alive connections for every Civitai request, retrying rate limits and server errors
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+))
+
 def fetch_data(target_count, continue_from_last=False):
-    """Fetch data from the Civitai API"""
+    """Fetch data from the Civitai API, yielding (items, progress, next cursor) pages.
+
+    The cursor is not saved here; the consumer saves it once the page is stored.
+    """
     try:
         api_key = os.getenv("CIVITAI_API_KEY")
         if not api_key:
@@ -20,13 +41,13 @@ def fetch_data(target_count, continue_from_last=False):
 
         # Initialize variables
         total_fetched = 0
-        page_size = min(100, target_count)  # Max 100 per request
 
         while total_fetched < target_count:
             # Prepare request
             url = "https://civitai.com/api/v1/images"
             params = {
-                "limit": page_size,
+                # Full pages halve the round trips; the last one asks only for what is still missing
+                "limit": min(PAGE_SIZE, target_count - total_fetched),
                 "sort": "Most Reactions",
                 "period": "Month"
             }
@@ -36,9 +57,9 @@ def fetch_data(target_count, continue_from_last=False):
             headers = {"Authorization": f"Bearer {api_key}"}
 
             # Make request
-            response = requests.get(url, params=params, headers=headers)
+            response = http_session.get(url, params=params, headers=headers)
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
 
             # Process response
             items = data.get("items", [])
@@ -48,15 +69,13 @@ def fetch_data(target_count, continue_from_last=False):
             # Update cursor for next request
             metadata = data.get("metadata", {})
             cursor = metadata.get("nextCursor")
-            if cursor:
-                save_cursor(cursor)
 
             # Calculate progress
             total_fetched += len(items)
             progress = min(100, int(total_fetched * 100 / target_count))
 
-            # Yield the batch and progress
-            yield items, progress
+            # Yield the batch, progress and the cursor that resumes after it
+            yield items, progress, cursor
 
             if not cursor:
                 break
@@ -64,3 +83,38 @@ def fetch_data(target_count, continue_from_last=False):
     except Exception as e:
         print(f"Error fetching data: {e}")
         raise
+
+def prefetch(pages, depth=PREFETCH_PAGES):
+    """Pull pages from an iterator on a background thread so the next one downloads while the current one is processed"""
+    page_queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def worker():
+        # No Streamlit calls here: session_state is only touched from the consuming thread
+        try:
+            for page in pages:
+                if stop.is_set():
+                    break
+                page_queue.put(page)
+        except Exception as e:
+            page_queue.put(e)
+        finally:
+            page_queue.put(done)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(worker)
+        page = None
+        try:
+            while True:
+                page = page_queue.get()
+                if page is done:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+        finally:
+            # If the consumer stopped early, drain the queue so the worker is never left blocked on put
+            stop.set()
+            while page is not done:
+                page = page_queue.get()
@@ -1,17 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
-from modules.datafetcher.qdrant_utils import store_in_vector_db
+from modules.datafetcher.fetcher import prefetch
+from modules.datafetcher.qdrant_utils import get_existing_ids, store_in_vector_db
 from modules.datafetcher.refined_data_utils import process_item
+from modules.datafetcher.embedding_utils import embed_prompts
+from modules.db_utils import save_cursor
 
-def process_and_store(data):
-    """Processes and stores the fetched data."""
-    if not data:
-        return 0, 0, 0, 0
+def prepare_items(data, seen_ids):
+    """Process raw items and embed the prompts of those not stored yet.
 
+    seen_ids holds the ids handled earlier in the run and is updated with this batch.
+    Returns the processed items, their vectors and the processed, skipped and error counts.
+    """
     processed = 0
-    stored = 0
     skipped = 0
     errors = 0
 
+    processed_items = []
     for item in data:
         try:
             # Skip None or empty items
@@ -22,11 +27,7 @@ def process_and_store(data):
             # Process item
             processed_item = process_item(item)
             if processed_item:
-                # Store processed item
-                if store_in_vector_db(processed_item):
-                    stored += 1
-                else:
-                    skipped += 1
+                processed_items.append(processed_item)
             else:
                 skipped += 1
             processed += 1
@@ -36,5 +37,108 @@ def process_and_store(data):
             print(f"Raw item data: {item}")
             errors += 1
 
+    # Duplicates and items already in Qdrant are skipped before they cost a forward pass
+    new_items = []
+    for processed_item in processed_items:
+        if processed_item["id"] not in seen_ids:
+            seen_ids.add(processed_item["id"])
+            new_items.append(processed_item)
+    if new_items:
+        existing_ids = get_existing_ids([processed_item["id"] for processed_item in new_items])
+        new_items = [processed_item for processed_item in new_items if processed_item["id"] not in existing_ids]
+    skipped += len(processed_items) - len(new_items)
+    processed_items = new_items
+
+    vectors = []
+    if processed_items:
+        # Embed every prompt of the batch in one call instead of one forward pass per item
+        try:
+            vectors = embed_prompts([processed_item["prompt"] for processed_item in processed_items])
+        except Exception as e:
+            print(f"Error embedding prompts: {e}")
+            errors += len(processed_items)
+            processed_items = []
+
+    return processed_items, vectors, processed, skipped, errors
+
+def process_and_store(data):
+    """Processes and stores the fetched data."""
+    if not data:
+        return 0, 0, 0, 0
+
+    processed_items, vectors, processed, skipped, errors = prepare_items(data, set())
+
+    stored = 0
+    if processed_items:
+        # Items that could not be stored are counted as skipped
+        stored = store_in_vector_db(processed_items, vectors)
+        skipped += len(processed_items) - stored
+
     print(f"Processing summary: Total={processed}, Stored={stored}, Skipped={skipped}, Errors={errors}")
     return processed, stored, skipped, errors
+
+def process_and_store_pages(pages):
+    """Process and store (items, progress, cursor) pages as they arrive.
+
+    The next page downloads and the previous one uploads while the current one is embedded.
+    A page's cursor is saved only once the page is stored, so a stopped or failed run resumes at it.
+    Yields the progress and the running processed, stored, skipped and error counts after each page.
+    """
+    processed = 0
+    stored = 0
+    skipped = 0
+    errors = 0
+    progress = 0
+    seen_ids = set()
+    # Once a page has errors or unstored items, later cursors would skip it, so none are saved
+    cursor_intact = True
+
+    # A single upload thread keeps at most one page of points in flight
+    upload_executor = ThreadPoolExecutor(max_workers=1)
+    pending = None
+
+    def commit_cursor(cursor):
+        """Save the cursor of a page that has been stored"""
+        if cursor_intact and cursor:
+            save_cursor(cursor)
+
+    def finish_upload():
+        """Wait for the in-flight upload, count its items as stored or skipped and save its cursor"""
+        nonlocal pending, stored, skipped, cursor_intact
+        future, count, cursor = pending
+        pending = None
+        page_stored = future.result()
+        stored += page_stored
+        skipped += count - page_stored
+        if page_stored < count:
+            cursor_intact = False
+        commit_cursor(cursor)
+
+    page_iter = prefetch(pages)
+    try:
+        for data, progress, cursor in page_iter:
+            processed_items, vectors, page_processed, page_skipped, page_errors = prepare_items(data or [], seen_ids)
+            processed += page_processed
+            skipped += page_skipped
+            errors += page_errors
+
+            if pending:
+                finish_upload()
+            if page_errors:
+                cursor_intact = False
+            if processed_items:
+                pending = (upload_executor.submit(store_in_vector_db, processed_items, vectors), len(processed_items), cursor)
+            else:
+                commit_cursor(cursor)
+
+            yield progress, processed, stored, skipped, errors
+
+        if pending:
+            finish_upload()
+            yield progress, processed, stored, skipped, errors
+    finally:
+        # Stopped early: the fetch thread is released and the in-flight upload finishes before returning;
+        # its cursor is not saved, so the next run fetches that page again and skips what is stored
+        page_iter.close()
+        upload_executor.shutdown()
+        print(f"Processing summary: Total={processed}, Stored={stored}, Skipped={skipped}, Errors={errors}")
@@ -1,8 +1,12 @@
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, CreateCollection, PointStruct
+import asyncio
+import threading
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http.models import (
+    Distance, VectorParams, CreateCollection, PointStruct, PayloadSchemaType, Datatype,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, OptimizersConfigDiff
+)
 import os
 from dotenv import load_dotenv
-import numpy as np
 
 # Load environment variables
 load_dotenv()
@@ -10,70 +14,186 @@ load_dotenv()
 # Collection name constant
 COLLECTION_NAME = "civitai_images"
 VECTOR_SIZE = 384  # Size of the vector for storing image embeddings
+UPSERT_BATCH_SIZE = 64  # Points sent per upsert request
+UPSERT_CONCURRENCY = 4  # Upsert requests in flight at once
+# The chat's similar-prompt search filters on "model"; points written by the
+# old_file scripts carry "baseModel", which their cleanup deletes by
+PAYLOAD_INDEX_FIELDS = ("model", "baseModel")
+INDEXING_THRESHOLD = 20000  # Qdrant default, in KB of vectors per segment
+
+def get_client_config():
+    """Read the Qdrant connection settings shared by the sync and async clients"""
+    qdrant_api_key = os.getenv("QDRANT_API_KEY")
+    if not qdrant_api_key:
+        raise ValueError("QDRANT_API_KEY not found in environment variables")
+    
+    qdrant_url = os.getenv("QDRANT_URL")
+    if not qdrant_url:
+        raise ValueError("QDRANT_URL not properly configured")
+    
+    return {
+        "url": qdrant_url,
+        "api_key": qdrant_api_key,
+        # gRPC sends vectors as packed binary floats instead of JSON arrays
+        "prefer_grpc": os.getenv("QDRANT_PREFER_GRPC", "true").lower() != "false",
+        "grpc_port": int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+    }
+
+# Bulk loads running in this process. Indexing is paused while any of them runs, so one
+# session finishing never re-enables it under another (other processes are not coordinated).
+# _indexing_paused stays set until the threshold is actually restored, so a failed restore is retried
+_bulk_loads = 0
+_indexing_paused = False
+_bulk_loads_lock = threading.Lock()
+
+# Shared client so collection setup and record counts reuse one connection instead of reconnecting per call
+_client = None
 
 def get_qdrant_client():
     """Get a connection to the Qdrant vector database"""
+    global _client
+    if _client is not None:
+        return _client
+    
     try:
-        qdrant_api_key = os.getenv("QDRANT_API_KEY")
-        if not qdrant_api_key:
-            raise ValueError("QDRANT_API_KEY not found in environment variables")
-        
-        qdrant_url = os.getenv("QDRANT_URL")
-        if not qdrant_url:
-            raise ValueError("QDRANT_URL not properly configured")
-        
-        return QdrantClient(
-            url=qdrant_url,
-            api_key=qdrant_api_key
-        )
+        # Only a successful connection is kept, so a failed one is retried on the next call
+        _client = QdrantClient(**get_client_config())
+        return _client
     except Exception as e:
         print(f"Error connecting to Qdrant: {e}")
         return None
 
-def store_in_vector_db(item):
-    """Store an item in the vector database"""
+def build_point(item, vector):
+    """Build the Qdrant point for a processed item and the embedding of its prompt (a list of floats)"""
+    return PointStruct(
+        id=item["id"],
+        vector=vector,
+        payload={
+            "name": item["name"],
+            "model": item["model"],
+            "prompt": item["prompt"],
+            "negative_prompt": item["negative_prompt"],
+            "image_url": item["image_url"],
+            "width": item["width"],
+            "height": item["height"],
+            "nsfw": item["nsfw"],
+            "nsfw_level": item["nsfw_level"],
+            "post_id": item["post_id"],
+            "username": item["username"],
+            "reaction_count": item["reaction_count"],
+            "comment_count": item["comment_count"],
+            "created_at": item["created_at"],
+            "hash": item["hash"]
+        }
+    )
+
+def get_existing_ids(ids):
+    """Return which of the given point ids are already stored, in a single request"""
     try:
         client = get_qdrant_client()
         if not client:
             raise ValueError("Could not establish connection to Qdrant")
 
-        # Generate a placeholder vector (replace with actual embedding later)
-        vector = np.random.rand(VECTOR_SIZE).tolist()
-
-        # Create point with payload
-        point = PointStruct(
-            id=item["id"],
-            vector=vector,
-            payload={
-                "name": item["name"],
-                "model": item["model"],
-                "prompt": item["prompt"],
-                "negative_prompt": item["negative_prompt"],
-                "image_url": item["image_url"],
-                "width": item["width"],
-                "height": item["height"],
-                "nsfw": item["nsfw"],
-                "nsfw_level": item["nsfw_level"],
-                "post_id": item["post_id"],
-                "username": item["username"],
-                "reaction_count": item["reaction_count"],
-                "comment_count": item["comment_count"],
-                "created_at": item["created_at"],
-                "hash": item["hash"]
-            }
-        )
-
-        # Upsert the point into the collection
-        operation = client.upsert(
+        points = client.retrieve(
             collection_name=COLLECTION_NAME,
-            points=[point]
+            ids=ids,
+            with_payload=False,
+            with_vectors=False
         )
+        return {point.id for point in points}
+
+    except Exception as e:
+        # Unknown ids are simply upserted again, which is harmless
+        print(f"Error checking existing ids: {e}")
+        return set()
+
+async def upsert_batches(batches):
+    """Upsert batches concurrently, at most UPSERT_CONCURRENCY at a time.
+
+    Returns one entry per batch: the update result, or the exception that made it fail.
+    """
+    # The async client is bound to the event loop, so it lives only as long as this asyncio.run call
+    client = AsyncQdrantClient(**get_client_config())
+    semaphore = asyncio.Semaphore(UPSERT_CONCURRENCY)
 
-        return operation.status == "completed"
+    async def upsert(batch):
+        async with semaphore:
+            # wait=False returns once Qdrant has accepted the points
+            return await client.upsert(
+                collection_name=COLLECTION_NAME,
+                points=batch,
+                wait=False
+            )
+
+    try:
+        return await asyncio.gather(*(upsert(batch) for batch in batches), return_exceptions=True)
+    finally:
+        await client.close()
+
+def store_in_vector_db(items, vectors):
+    """Store items in the vector database with the embeddings of their prompts.
 
+    Points are upserted UPSERT_BATCH_SIZE at a time, several batches in flight at once;
+    returns the number of items stored.
+    """
+    # One tolist() call converts the whole (N, 384) matrix instead of one call per row
+    points = [build_point(item, vector) for item, vector in zip(items, vectors.tolist())]
+    batches = [points[start:start + UPSERT_BATCH_SIZE] for start in range(0, len(points), UPSERT_BATCH_SIZE)]
+    try:
+        results = asyncio.run(upsert_batches(batches))
     except Exception as e:
         print(f"Error storing in vector DB: {e}")
-        return False
+        return 0
+
+    stored = 0
+    for batch, result in zip(batches, results):
+        if isinstance(result, Exception):
+            print(f"Error storing batch of {len(batch)} items in vector DB: {result}")
+        elif result.status in ("acknowledged", "completed"):
+            stored += len(batch)
+
+    return stored
+
+def ensure_collection(client):
+    """Create the collection and its payload indexes if they are missing.
+
+    This is the only definition of the collection; the old_file scripts call it too.
+    Returns True if the collection was created.
+    """
+    # Check if collection exists
+    collections = client.get_collections().collections
+    created = not any(col.name == COLLECTION_NAME for col in collections)
+
+    if created:
+        # Create collection with vector configuration
+        client.create_collection(
+            collection_name=COLLECTION_NAME,
+            vectors_config=VectorParams(
+                size=VECTOR_SIZE,
+                distance=Distance.COSINE,
+                # Embeddings are unit-normalized, so float16 keeps their precision at half the size
+                datatype=Datatype.FLOAT16,
+                on_disk=True  # Full vectors stay on disk, only used for rescoring
+            ),
+            # int8 copies of the vectors are kept in RAM for search
+            quantization_config=ScalarQuantization(
+                scalar=ScalarQuantizationConfig(
+                    type=ScalarType.INT8,
+                    quantile=0.99,
+                    always_ram=True
+                )
+            )
+        )
+
+    # Keyword indexes so filters don't scan every payload (no-op if they already exist)
+    for field_name in PAYLOAD_INDEX_FIELDS:
+        client.create_payload_index(
+            collection_name=COLLECTION_NAME,
+            field_name=field_name,
+            field_schema=PayloadSchemaType.KEYWORD
+        )
+
+    return created
 
 def initialize_collection():
     """Initialize the Qdrant collection"""
@@ -82,29 +202,61 @@ def initialize_collection():
         if not client:
             raise ValueError("Could not establish connection to Qdrant")
 
-        # Check if collection exists
-        collections = client.get_collections().collections
-        exists = any(col.name == COLLECTION_NAME for col in collections)
-
-        if not exists:
-            # Create collection with vector configuration
-            client.create_collection(
-                collection_name=COLLECTION_NAME,
-                vectors_config=VectorParams(
-                    size=VECTOR_SIZE,
-                    distance=Distance.COSINE
-                )
-            )
+        if ensure_collection(client):
             print(f"Collection {COLLECTION_NAME} created successfully")
         else:
             print(f"Collection {COLLECTION_NAME} already exists")
 
+        # Retry a resume that failed at the end of an earlier load
+        restore_indexing()
+
         return True
 
     except Exception as e:
         print(f"Error initializing collection: {e}")
         return False
 
+def set_indexing_threshold(threshold):
+    """Set the collection's indexing threshold; 0 stops new segments from being indexed"""
+    client = get_qdrant_client()
+    if not client:
+        raise ValueError("Could not establish connection to Qdrant")
+
+    client.update_collection(
+        collection_name=COLLECTION_NAME,
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=threshold)
+    )
+
+def pause_indexing():
+    """Start a bulk load: the first concurrent load pauses HNSW indexing of new points.
+
+    Every successful call must be matched by one resume_indexing call.
+    """
+    global _bulk_loads, _indexing_paused
+    with _bulk_loads_lock:
+        if not _indexing_paused:
+            set_indexing_threshold(0)
+            _indexing_paused = True
+        _bulk_loads += 1
+
+def resume_indexing():
+    """End a bulk load: the last one still running re-enables indexing so its points are indexed in one pass"""
+    global _bulk_loads
+    with _bulk_loads_lock:
+        _bulk_loads -= 1
+    restore_indexing()
+
+def restore_indexing():
+    """Re-enable indexing if this process paused it and no bulk load is running.
+
+    The pause is only cleared once the threshold is restored, so after a failure any later call retries.
+    """
+    global _indexing_paused
+    with _bulk_loads_lock:
+        if _bulk_loads == 0 and _indexing_paused:
+            set_indexing_threshold(INDEXING_THRESHOLD)
+            _indexing_paused = False
+
 def get_total_records_count():
     """Get the total number of records in the vector database"""
     try:
@@ -1,3 +1,6 @@
+# Stats summed into an item's reaction count
+REACTION_KEYS = ("heartCount", "likeCount", "laughCount", "cryCount")
+
 def process_item(item):
     """Process a single item from the Civitai API response"""
     if not item:
@@ -20,13 +23,8 @@ def process_item(item):
         username = item.get("username", "")
 
         # Get reactions and stats
-        stats = item.get("stats", {})
-        reaction_count = (
-            stats.get("heartCount", 0) +
-            stats.get("likeCount", 0) +
-            stats.get("laughCount", 0) +
-            stats.get("cryCount", 0)
-        )
+        stats = item.get("stats") or {}  # Use empty dict if stats is None
+        reaction_count = sum(stats.get(key) or 0 for key in REACTION_KEYS)
         comment_count = stats.get("commentCount", 0)
 
         # Create processed item
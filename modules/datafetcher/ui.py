@@ -1,12 +1,12 @@
+import queue
+import threading
 import streamlit as st
 from modules.datafetcher.fetcher import fetch_data
-from modules.datafetcher.processor import process_and_store
-from modules.datafetcher.utils import clear_messages, load_environment_variables
+from modules.datafetcher.embedding_utils import get_embedder
+from modules.datafetcher.processor import process_and_store_pages
 from modules.datafetcher.qdrant_utils import initialize_collection, get_total_records_count
 from modules.db_utils import load_cursor
 
-# Initialize fetch status
-
 
 def fetch_prompts_ui():
     """UI for the fetch prompts functionality"""
@@ -19,8 +19,8 @@ def fetch_prompts_ui():
         st.session_state.collection_initialized = initialize_collection()
     if "fetch_status" not in st.session_state:
         st.session_state.fetch_status = False
-    if "stop_fetch" not in st.session_state:
-        st.session_state.stop_fetch = False
+    if "fetch_job" not in st.session_state:
+        st.session_state.fetch_job = None
 
     st.title("Fetch Prompts")
 
@@ -49,32 +49,19 @@ def fetch_prompts_ui():
         st.session_state.fetch_mode = "new" if fetch_mode == "New fetch" else "continue"
 
     with col2:
-        # Create placeholders for status updates
-        status_placeholder = st.empty()
-        details_placeholder = st.empty()
-        
-        # Stop button (only show when fetch is running)
-        stop_button = st.empty()
-        
-        # Fetch button and stop button container
-        button_col1, button_col2 = st.columns(2)
-        
-        with button_col1:
-            if st.button("Fetch Prompts", type="primary", disabled=st.session_state.fetch_status):
-                st.session_state.stop_fetch = False
-                continue_from_last = (fetch_mode == "Continue from last")
-                check_new_images(
-                    continue_from_last=continue_from_last,
-                    status_placeholder=status_placeholder,
-                    details_placeholder=details_placeholder,
-                    summary_container=st.container()
-                )
-        
-        with button_col2:
+        if st.button("Fetch Prompts", type="primary", disabled=st.session_state.fetch_status):
+            start_fetch_job(continue_from_last=(fetch_mode == "Continue from last"))
+            # Rerun so the button is disabled while the job runs
+            st.rerun()
+
+        # A running job's progress refreshes on its own without rerunning the page;
+        # a finished job's summary is static, so nothing polls once it is done
+        job = st.session_state.fetch_job
+        if job is not None:
             if st.session_state.fetch_status:
-                if st.button("Stop", type="secondary"):
-                    st.session_state.stop_fetch = True
-                    status_placeholder.write("⏹️ Stopping...")
+                fetch_progress_panel()
+            else:
+                fetch_summary(job["state"])
 
     # Status section below the main controls (static)
     st.write("\n---\n")  # Add line break before status
@@ -102,106 +89,115 @@ def fetch_prompts_ui():
             st.warning("Unable to fetch record count")
 
 
-def check_new_images(continue_from_last=False, status_placeholder=None, details_placeholder=None, summary_container=None):
-    """Check for new images and process them"""
-    try:
-        # Update session state
-        st.session_state.fetch_status = True
+def clear_messages():
+    st.session_state.messages = []
 
-        # Use the passed placeholders
-        status_text = status_placeholder
-        details_area = details_placeholder
 
-        # Initialize
-        status_text.write("🔄 Initializing...")
-        
-        clear_messages()
-        st.session_state.job_status = "Running"
+def start_fetch_job(continue_from_last=False):
+    """Start fetching and processing images on a background thread"""
+    # Load the embedder on the script thread, so the job thread only reads the cached model
+    get_embedder()
 
-        # Get target count
-        target_count = st.session_state.get("target_count", 200)
+    clear_messages()
+    st.session_state.job_status = "Running"
+    st.session_state.fetch_status = True
 
-        # Fetch Phase
-        status_text.write("🔄 Fetching Data")
-        details_area.write("Setting up API connection...")
+    job = {
+        # Progress events from the job thread; the panel only reads from here
+        "events": queue.Queue(),
+        "stop": threading.Event(),
+        "state": {"status": "running", "progress": 0, "processed": 0, "stored": 0, "skipped": 0, "errors": 0}
+    }
+    thread = threading.Thread(
+        target=run_fetch_job,
+        args=(st.session_state.get("target_count", 200), continue_from_last, job["events"], job["stop"]),
+        daemon=True
+    )
+    thread.start()
+    st.session_state.fetch_job = job
 
-        try:
-            # Fetch data with progress updates
-            all_data = []
-            for batch_data, progress in fetch_data(target_count, continue_from_last):
-                if st.session_state.stop_fetch:
-                    status_text.write("⏹️ Stopped by user")
-                    st.session_state.fetch_status = False
-                    return
-                
-                all_data.extend(batch_data)
-                status_text.write(f"🔄 Fetching Data ({progress}%)")
-                details_area.write(f"Fetched {len(all_data)} images so far...")
-                st.rerun()
-
-            # Processing Phase
-            if all_data:
-                status_text.write("🔄 Processing Images")
-                total = len(all_data)
-
-                # Process in batches for better UI updates
-                processed = 0
-                stored = 0
-                skipped = 0
-                errors = 0
-                batch_size = 10
-
-                for i in range(0, len(all_data), batch_size):
-                    if st.session_state.stop_fetch:
-                        status_text.write("⏹️ Stopped by user")
-                        st.session_state.fetch_status = False
-                        return
-
-                    batch = all_data[i:i+batch_size]
-                    batch_processed, batch_stored, batch_skipped, batch_errors = process_and_store(batch)
-                    
-                    processed += batch_processed
-                    stored += batch_stored
-                    skipped += batch_skipped
-                    errors += batch_errors
-                    
-                    progress = min(100, int((i + batch_size) * 100 / total))
-                    status_text.write(f"🔄 Processing Images ({progress}%)")
-                    details_area.write(f"Processed: {processed}, Stored: {stored}, Skipped: {skipped}, Errors: {errors}")
-                    st.rerun()
-
-                # Show final summary
-                with summary_container:
-                    st.write("---")
-                    st.write("### Processing Summary")
-                    summary_column1, summary_column2 = st.columns(2)
-                    with summary_column1:
-                        st.write("#### Statistics")
-                        st.write(f"- ✅ Stored: {stored}")
-                        st.write(f"- ⏭️ Skipped: {skipped}")
-                    with summary_column2:
-                        st.write("#### Status")
-                        st.write(f"- 📊 Total: {processed}")
-                        st.write(f"- ❌ Errors: {errors}")
-
-                if errors > 0:
-                    status_text.write("❌ Completed with errors")
-                else:
-                    status_text.write("✅ Processing complete")
-            else:
-                status_text.write("❌ No data to process")
 
-        except Exception as e:
-            status_text.write(f"❌ Error: {str(e)}")
-            raise e
+def run_fetch_job(target_count, continue_from_last, events, stop):
+    """Fetch, embed and store pages as they arrive, reporting progress through the events queue.
+
+    Runs on the job thread, so it never touches Streamlit or session state.
+    """
+    state = {"status": "running", "progress": 0, "processed": 0, "stored": 0, "skipped": 0, "errors": 0}
+    try:
+        pages = fetch_data(target_count, continue_from_last)
+        for progress, processed, stored, skipped, errors in process_and_store_pages(pages):
+            state = {
+                "status": "running",
+                "progress": progress,
+                "processed": processed,
+                "stored": stored,
+                "skipped": skipped,
+                "errors": errors
+            }
+            if stop.is_set():
+                events.put({**state, "status": "stopped"})
+                return
+            events.put(state)
+
+        events.put({**state, "status": "done"})
 
     except Exception as e:
-        if 'status_text' in locals():
-            status_text.write(f"❌ Error: {str(e)}")
-        st.error(f"Error during processing: {str(e)}")
-    finally:
-        st.session_state.fetch_status = False
-        st.session_state.stop_fetch = False
+        events.put({**state, "status": "error", "error": str(e)})
+
+
+@st.fragment(run_every=1.0)
+def fetch_progress_panel():
+    """Show the progress of the running fetch job, polling its events every second"""
+    job = st.session_state.fetch_job
+
+    # Only the latest event matters
+    while True:
+        try:
+            job["state"] = job["events"].get_nowait()
+        except queue.Empty:
+            break
+    state = job["state"]
+
+    if state["status"] == "running":
+        if job["stop"].is_set():
+            st.write("⏹️ Stopping...")
+        else:
+            st.write(f"🔄 Fetching and Processing Images ({state['progress']}%)")
+        st.write(f"Processed: {state['processed']}, Stored: {state['stored']}, Skipped: {state['skipped']}, Errors: {state['errors']}")
+        if st.button("Stop", type="secondary"):
+            job["stop"].set()
+        return
+
+    st.session_state.fetch_status = False
+    st.session_state.job_status = "Idle"
+    # The job saved the cursor of every page it stored
+    st.session_state.last_cursor = load_cursor()
+    # Rerun the whole page so the summary replaces this panel and the fetch button and record count refresh
+    st.rerun()
+
+
+def fetch_summary(state):
+    """Show how the last fetch job ended"""
+    if state["status"] == "stopped":
+        st.write("⏹️ Stopped by user")
+    elif state["status"] == "error":
+        st.write(f"❌ Error: {state['error']}")
+        st.error(f"Error during processing: {state['error']}")
+    elif state["errors"] > 0:
+        st.write("❌ Completed with errors")
+    elif state["processed"] or state["skipped"]:
+        st.write("✅ Processing complete")
+    else:
+        st.write("❌ No data to process")
+
+    if state["processed"] or state["skipped"] or state["errors"]:
+        # Show final summary
+        st.write("---")
+        st.write("### Processing Summary")
+        st.write(f"- ✅ Stored: {state['stored']}")
+        st.write(f"- ⏭️ Skipped: {state['skipped']}")
+        st.write(f"- 📊 Total: {state['processed']}")
+        st.write(f"- ❌ Errors: {state['errors']}")
 
 
 # Run the UI
@@ -1,11 +1,18 @@
 """Database utilities module"""
 import os
+import time
+import atexit
+import logging
+import queue
 import sqlite3
 import datetime
+import threading
 import uuid
 import streamlit as st
 from contextlib import contextmanager
 
+logger = logging.getLogger(__name__)
+
 # Database file path
 DB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
 os.makedirs(DB_DIR, exist_ok=True)  # Create data directory if it doesn't exist
@@ -15,24 +22,170 @@ DB_PATH = os.path.join(DB_DIR, 'app.db')
 _DB_INITIALIZED = False
 
 # Database version
-CURRENT_DB_VERSION = 1  # Decrement this to 1 since schema has been simplified
+CURRENT_DB_VERSION = 6  # Schema version, stored in PRAGMA user_version
+
+# Columns selected as "name [timestamp]" come back as datetime objects.
+# Registered explicitly because Python 3.12 deprecates the default converters.
+sqlite3.register_converter(
+    "timestamp", lambda value: datetime.datetime.fromisoformat(value.decode())
+)
+
+# Maximum number of idle read-only connections kept open for reuse.
+# In WAL mode readers never block each other or the writer.
+POOL_SIZE = 5
+_POOL = queue.Queue(maxsize=POOL_SIZE)
+
+# All writes go through one dedicated connection, one caller at a time
+_writer = None
+_writer_lock = threading.Lock()
+
+# How often idle pooled connections refresh query planner statistics
+OPTIMIZE_INTERVAL = 60 * 60  # seconds
+_optimizer_started = False
+_optimizer_lock = threading.Lock()
+
+# Prepared statements cached per pooled connection
+STATEMENT_CACHE_SIZE = 128
 
-def get_db_connection():
+# Hot-path SQL kept as constants so every call reuses the exact same text
+# and is served from the connection's prepared-statement cache
+_SQL_INSERT_MESSAGE = "INSERT INTO chat_messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)"
+_SQL_INSERT_PROMPT_PAIR = "INSERT INTO prompt_history (session_id, original, refined, timestamp) VALUES (?, ?, ?, ?)"
+_SQL_TOUCH_SESSION = "UPDATE chat_sessions SET updated_at = ? WHERE id = ?"
+_SQL_UPSERT_CURSOR = (
+    "INSERT INTO app_settings (key, value, updated_at) VALUES ('last_cursor', ?, ?) "
+    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at"
+)
+_SQL_SELECT_CHAT_HISTORY = (
+    'SELECT id, role, content, created_at AS "created_at [timestamp]" FROM chat_messages '
+    "WHERE session_id = ? AND (? IS NULL OR id < ?) "
+    "ORDER BY created_at DESC LIMIT ?"
+)
+_SQL_SELECT_PROMPT_HISTORY = (
+    'SELECT original, refined, timestamp AS "timestamp [timestamp]" FROM prompt_history '
+    "WHERE session_id = ? ORDER BY timestamp"
+)
+# Sessions store the start of their first user message, so the sidebar reads one flat table
+_SQL_SET_SESSION_TITLE = "UPDATE chat_sessions SET title = COALESCE(title, ?) WHERE id = ?"
+_SQL_SELECT_SESSIONS = (
+    'SELECT id, title, created_at AS "created_at [timestamp]", updated_at AS "updated_at [timestamp]" '
+    "FROM chat_sessions ORDER BY updated_at DESC"
+)
+# Sidebar titles show the first 30 characters; one more tells whether an ellipsis is needed
+TITLE_LENGTH = 30
+
+# Chat messages are buffered and written in batches once either limit is hit
+MESSAGE_FLUSH_SIZE = 50
+MESSAGE_FLUSH_INTERVAL = 0.25  # seconds
+_MSG_BUFFER = []
+_MSG_BUFFER_LOCK = threading.Lock()
+_last_flush = time.monotonic()
+
+def get_db_connection(read_only=False):
     """Get a database connection with proper settings"""
-    conn = sqlite3.connect(DB_PATH, timeout=20)  # Add timeout for busy waiting
-    conn.execute("PRAGMA journal_mode=WAL")  # Use Write-Ahead Logging
+    # Streamlit runs each script rerun in its own thread, so pooled
+    # connections must be usable from threads other than their creator
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=20,  # Add timeout for busy waiting
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        detect_types=sqlite3.PARSE_COLNAMES  # Convert "[timestamp]" columns in the C layer
+    )
     conn.execute("PRAGMA busy_timeout=10000")  # Wait up to 10 seconds if db is locked
+    conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, avoids an fsync per commit
+    conn.execute("PRAGMA cache_size=-64000")  # 64MB page cache
+    conn.execute("PRAGMA temp_store=MEMORY")  # Keep sort/temp tables in RAM
+    conn.execute("PRAGMA mmap_size=268435456")  # Memory-map up to 256MB of the file
+    conn.execute("PRAGMA optimize=0x10002")  # Refresh planner stats for a long-lived connection
+    if read_only:
+        conn.execute("PRAGMA query_only=true")  # Reject writes on reader connections
     conn.row_factory = sqlite3.Row
+    _start_optimizer()
     return conn
 
+def _close_connection(conn):
+    """Close a connection, letting SQLite update planner statistics first"""
+    try:
+        conn.execute("PRAGMA optimize")
+    except sqlite3.Error:
+        pass
+    conn.close()
+
+def _optimize_periodically():
+    """Background loop that runs PRAGMA optimize on the writer connection"""
+    while True:
+        time.sleep(OPTIMIZE_INTERVAL)
+        try:
+            with get_writer() as conn:
+                conn.execute("PRAGMA optimize")
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error("Error optimizing database: %s", e)
+
+def _start_optimizer():
+    """Start the periodic optimize thread once per process"""
+    global _optimizer_started
+    with _optimizer_lock:
+        if _optimizer_started:
+            return
+        _optimizer_started = True
+    threading.Thread(target=_optimize_periodically, name="sqlite-optimize", daemon=True).start()
+
+def close_pool():
+    """Close every idle pooled connection and the writer connection"""
+    global _writer
+    while True:
+        try:
+            conn = _POOL.get_nowait()
+        except queue.Empty:
+            break
+        _close_connection(conn)
+    
+    with _writer_lock:
+        if _writer is not None:
+            _close_connection(_writer)
+            _writer = None
+
 @contextmanager
-def get_db():
-    """Context manager for database connections"""
-    conn = get_db_connection()
+def get_writer():
+    """Context manager for the single writer connection (not reentrant)
+    
+    The connection is handed out inside a BEGIN IMMEDIATE transaction, so the
+    write lock is taken up front instead of upgrading from a read lock
+    mid-transaction (which can fail with SQLITE_BUSY). Callers commit as
+    usual; anything left uncommitted is rolled back.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = get_db_connection()
+            _writer.isolation_level = None  # Transactions are managed explicitly
+        _writer.execute("BEGIN IMMEDIATE")
+        try:
+            yield _writer
+        finally:
+            # Never leave a half-finished transaction behind
+            if _writer.in_transaction:
+                _writer.rollback()
+
+@contextmanager
+def get_reader():
+    """Context manager that borrows a read-only connection from the pool"""
+    try:
+        conn = _POOL.get_nowait()
+    except queue.Empty:
+        conn = get_db_connection(read_only=True)
     try:
         yield conn
     finally:
-        conn.close()
+        # Never hand out a connection with a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _POOL.put_nowait(conn)
+        except queue.Full:
+            _close_connection(conn)
 
 def init_db():
     """Initialize the SQLite database with required tables and run migrations"""
@@ -41,70 +194,149 @@ def init_db():
         return
     
     try:
-        with get_db() as conn:
+        # journal_mode is persistent in the database file, so it is set once here instead of on
+        # every connection; it can't be changed inside the writer's transaction, hence a one-shot connection
+        conn = sqlite3.connect(DB_PATH, timeout=20)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")  # Use Write-Ahead Logging
+        finally:
+            conn.close()
+        
+        with get_writer() as conn:
             c = conn.cursor()
             
-            # Drop existing tables to ensure clean schema
-            c.execute("DROP TABLE IF EXISTS chat_messages")
-            c.execute("DROP TABLE IF EXISTS prompt_history")
-            c.execute("DROP TABLE IF EXISTS chat_sessions")
-            c.execute("DROP TABLE IF EXISTS db_version")
+            # Fast path: the schema on disk is already at the current version
+            c.execute("PRAGMA user_version")
+            db_version = c.fetchone()[0]
+            if db_version == CURRENT_DB_VERSION:
+                _DB_INITIALIZED = True
+                return
+            
+            if db_version < 1:
+                # Tables from before user_version was tracked are kept as they are;
+                # every CREATE below is a no-op for them, so existing chats survive
+                
+                # Create version table first
+                c.execute('''
+                    CREATE TABLE IF NOT EXISTS db_version (
+                        version INTEGER PRIMARY KEY
+                    )
+                ''')
+                
+                # Get or set initial version
+                c.execute("SELECT version FROM db_version")
+                result = c.fetchone()
+                if not result:
+                    c.execute("INSERT INTO db_version (version) VALUES (1)")
+                    current_version = 1
+                else:
+                    current_version = result[0]
+                
+                # Create required tables
+                c.execute('''
+                    CREATE TABLE IF NOT EXISTS chat_sessions (
+                        id TEXT PRIMARY KEY,
+                        created_at TEXT NOT NULL,
+                        updated_at TEXT NOT NULL
+                    )
+                ''')
+                
+                c.execute('''
+                    CREATE TABLE IF NOT EXISTS chat_messages (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        session_id TEXT NOT NULL,
+                        role TEXT NOT NULL,
+                        content TEXT NOT NULL,
+                        created_at TEXT NOT NULL,
+                        FOREIGN KEY (session_id) REFERENCES chat_sessions(id)
+                    )
+                ''')
+                
+                # Lets the session title lookup in get_all_sessions use a single index seek
+                c.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_chat_messages_session_role_created
+                    ON chat_messages(session_id, role, created_at)
+                ''')
+                
+                c.execute('''
+                    CREATE TABLE IF NOT EXISTS prompt_history (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        session_id TEXT NOT NULL,
+                        original TEXT NOT NULL,
+                        refined TEXT NOT NULL,
+                        timestamp TEXT NOT NULL,
+                        FOREIGN KEY (session_id) REFERENCES chat_sessions(id)
+                    )
+                ''')
+            
+            if db_version < 2:
+                # Composite indices for the hot history/title queries
+                c.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_chat_messages_session_created
+                    ON chat_messages(session_id, created_at)
+                ''')
+                c.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_prompt_history_session_timestamp
+                    ON prompt_history(session_id, timestamp)
+                ''')
+                
+                # Give the query planner statistics for the new indices
+                c.execute("ANALYZE")
             
-            # Create version table first
-            c.execute('''
-                CREATE TABLE IF NOT EXISTS db_version (
-                    version INTEGER PRIMARY KEY
-                )
-            ''')
+            if db_version < 3:
+                # Key/value settings such as the Civitai fetch cursor
+                c.execute('''
+                    CREATE TABLE IF NOT EXISTS app_settings (
+                        key TEXT PRIMARY KEY,
+                        value TEXT,
+                        updated_at TEXT NOT NULL
+                    )
+                ''')
             
-            # Get or set initial version
-            c.execute("SELECT version FROM db_version")
-            result = c.fetchone()
-            if not result:
-                c.execute("INSERT INTO db_version (version) VALUES (1)")
-                current_version = 1
-            else:
-                current_version = result[0]
+            # Version 4 added the fetch scripts' embedding cache, which now has its own
+            # database file (old_file/embedding_cache.py); version 6 drops the old table
             
-            # Create required tables
-            c.execute('''
-                CREATE TABLE IF NOT EXISTS chat_sessions (
-                    id TEXT PRIMARY KEY,
-                    created_at TEXT NOT NULL,
-                    updated_at TEXT NOT NULL
-                )
-            ''')
+            if db_version < 5:
+                # First user message of each session, kept on the session row for the sidebar
+                c.execute("ALTER TABLE chat_sessions ADD COLUMN title TEXT")
+                c.execute(f'''
+                    UPDATE chat_sessions SET title = (
+                        SELECT substr(m.content, 1, {TITLE_LENGTH + 1}) FROM chat_messages m
+                        WHERE m.session_id = chat_sessions.id AND m.role = 'user'
+                        ORDER BY m.created_at LIMIT 1
+                    )
+                ''')
+                # The sidebar lists sessions by last update
+                c.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated
+                    ON chat_sessions(updated_at)
+                ''')
             
-            c.execute('''
-                CREATE TABLE IF NOT EXISTS chat_messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    role TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    created_at TEXT NOT NULL,
-                    FOREIGN KEY (session_id) REFERENCES chat_sessions(id)
-                )
-            ''')
+            if db_version < 6:
+                c.execute("DROP TABLE IF EXISTS embedding_cache")
             
-            c.execute('''
-                CREATE TABLE IF NOT EXISTS prompt_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    original TEXT NOT NULL,
-                    refined TEXT NOT NULL,
-                    timestamp TEXT NOT NULL,
-                    FOREIGN KEY (session_id) REFERENCES chat_sessions(id)
-                )
-            ''')
+            # Record the schema version so later starts take the fast path
+            c.execute(f"PRAGMA user_version = {CURRENT_DB_VERSION}")
             
             conn.commit()
             _DB_INITIALIZED = True
-            print("Database initialized successfully")
+            logger.debug("Database initialized successfully")
+            
+        if os.getenv("DEBUG_DB"):
+            check_db_structure()
             
     except Exception as e:
-        print(f"Error initializing database: {str(e)}")
+        logger.error("Error initializing database: %s", e)
         raise
 
+def _insert_session(c, session_id):
+    """Insert a new chat session row using an open cursor (caller commits)"""
+    now = datetime.datetime.now().isoformat()
+    c.execute(
+        "INSERT INTO chat_sessions (id, created_at, updated_at) VALUES (?, ?, ?)",
+        (session_id, now, now)
+    )
+
 def get_or_create_session():
     """Get the current session ID or create a new one"""
     if "chat_session_id" not in st.session_state:
@@ -112,13 +344,9 @@ def get_or_create_session():
         session_id = str(uuid.uuid4())
         
         # Create a new session in the database
-        with get_db() as conn:
+        with get_writer() as conn:
             c = conn.cursor()
-            now = datetime.datetime.now().isoformat()
-            c.execute(
-                "INSERT INTO chat_sessions (id, created_at, updated_at) VALUES (?, ?, ?)",
-                (session_id, now, now)
-            )
+            _insert_session(c, session_id)
             conn.commit()
             st.session_state.chat_session_id = session_id
     
@@ -126,121 +354,158 @@ def get_or_create_session():
 
 def update_session_timestamp(session_id):
     """Update the last_updated timestamp for a session"""
-    with get_db() as conn:
+    with get_writer() as conn:
         c = conn.cursor()
         now = datetime.datetime.now().isoformat()
-        c.execute(
-            "UPDATE chat_sessions SET updated_at = ? WHERE id = ?",
-            (now, session_id)
-        )
+        c.execute(_SQL_TOUCH_SESSION, (now, session_id))
         conn.commit()
 
+def flush_messages():
+    """Write all buffered chat messages to the database in one transaction"""
+    global _last_flush
+    with _MSG_BUFFER_LOCK:
+        if not _MSG_BUFFER:
+            _last_flush = time.monotonic()
+            return
+        
+        # Latest message timestamp per session, for the updated_at bump,
+        # and the first buffered user message per session as a title candidate
+        session_updates = {}
+        session_titles = {}
+        for session_id, role, content, timestamp in _MSG_BUFFER:
+            session_updates[session_id] = timestamp
+            if role == "user":
+                session_titles.setdefault(session_id, content[:TITLE_LENGTH + 1])
+        
+        with get_writer() as conn:
+            c = conn.cursor()
+            c.executemany(_SQL_INSERT_MESSAGE, _MSG_BUFFER)
+            
+            # Update each session's last_updated timestamp
+            c.executemany(
+                _SQL_TOUCH_SESSION,
+                [(timestamp, session_id) for session_id, timestamp in session_updates.items()]
+            )
+            
+            # Only sessions without a title take one, so it stays the first user message
+            c.executemany(
+                _SQL_SET_SESSION_TITLE,
+                [(title, session_id) for session_id, title in session_titles.items()]
+            )
+            
+            conn.commit()
+        
+        _MSG_BUFFER.clear()
+        _last_flush = time.monotonic()
+
+# Make sure nothing buffered is lost when the process exits; atexit runs
+# handlers in reverse order, so the flush happens before the pool closes
+atexit.register(close_pool)
+atexit.register(flush_messages)
+
 def save_message(role, content):
-    """Save a message to the database"""
+    """Save a message to the database (buffered, see flush_messages)"""
     session_id = get_or_create_session()
     timestamp = datetime.datetime.now().isoformat()
     
-    with get_db() as conn:
-        c = conn.cursor()
-        c.execute(
-            "INSERT INTO chat_messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
-            (session_id, role, content, timestamp)
-        )
-        
-        # Update the session's last_updated timestamp
-        c.execute(
-            "UPDATE chat_sessions SET updated_at = ? WHERE id = ?",
-            (timestamp, session_id)
+    with _MSG_BUFFER_LOCK:
+        _MSG_BUFFER.append((session_id, role, content, timestamp))
+        should_flush = (
+            len(_MSG_BUFFER) >= MESSAGE_FLUSH_SIZE
+            or time.monotonic() - _last_flush >= MESSAGE_FLUSH_INTERVAL
         )
-        
-        conn.commit()
+    
+    if should_flush:
+        flush_messages()
 
 def save_prompt_pair(original, refined):
     """Save an original and refined prompt pair to the database"""
     session_id = get_or_create_session()
-    with get_db() as conn:
+    with get_writer() as conn:
         c = conn.cursor()
         timestamp = datetime.datetime.now().isoformat()
         
-        c.execute(
-            "INSERT INTO prompt_history (session_id, original, refined, timestamp) VALUES (?, ?, ?, ?)",
-            (session_id, original, refined, timestamp)
-        )
+        c.execute(_SQL_INSERT_PROMPT_PAIR, (session_id, original, refined, timestamp))
         
         # Update the session's last_updated timestamp
-        c.execute(
-            "UPDATE chat_sessions SET updated_at = ? WHERE id = ?",
-            (timestamp, session_id)
-        )
+        c.execute(_SQL_TOUCH_SESSION, (timestamp, session_id))
         
         conn.commit()
 
-def load_chat_history():
-    """Load chat history from the database for the current session"""
-    session_id = get_or_create_session()
+def get_max_message_id(session_id):
+    """Get the id of the newest message stored for a session (None if empty)"""
+    flush_messages()
     
-    with get_db() as conn:
+    with get_reader() as conn:
         c = conn.cursor()
-        c.execute(
-            "SELECT role, content, created_at FROM chat_messages WHERE session_id = ? ORDER BY created_at",
-            (session_id,)
-        )
+        c.execute("SELECT MAX(id) FROM chat_messages WHERE session_id = ?", (session_id,))
+        return c.fetchone()[0]
+
+def load_chat_history(limit=50, before_id=None):
+    """Load the most recent chat messages for the current session
+    
+    Returns up to `limit` messages in chronological order. Pass the id of the
+    oldest message already loaded as `before_id` to page further back.
+    """
+    session_id = get_or_create_session()
+    # Message ids only ever grow, so the newest id identifies the session's
+    # current contents and unchanged sessions are served from the cache
+    max_id = get_max_message_id(session_id)
+    return _load_chat_history_page(session_id, max_id, limit, before_id)
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _load_chat_history_page(session_id, max_id, limit, before_id):
+    """Read one page of chat history; max_id is only part of the cache key"""
+    with get_reader() as conn:
+        c = conn.cursor()
+        c.execute(_SQL_SELECT_CHAT_HISTORY, (session_id, before_id, before_id, limit))
         
         messages = []
-        for role, content, timestamp in c.fetchall():
-            timestamp_dt = datetime.datetime.fromisoformat(timestamp)
+        for message_id, role, content, timestamp in c:
             messages.append({
+                "id": message_id,
                 "role": role,
                 "content": content,
-                "timestamp": timestamp_dt
+                "timestamp": timestamp
             })
+        # Rows come back newest first
+        messages.reverse()
         return messages
 
 def load_prompt_history():
     """Load prompt history from the database for the current session"""
     session_id = get_or_create_session()
     
-    with get_db() as conn:
+    with get_reader() as conn:
         c = conn.cursor()
-        c.execute(
-            "SELECT original, refined, timestamp FROM prompt_history WHERE session_id = ? ORDER BY timestamp",
-            (session_id,)
-        )
+        c.execute(_SQL_SELECT_PROMPT_HISTORY, (session_id,))
         
         prompts = []
-        for original, refined, timestamp in c.fetchall():
-            timestamp_dt = datetime.datetime.fromisoformat(timestamp)
+        for original, refined, timestamp in c:
             prompts.append({
                 "original": original,
                 "refined": refined,
-                "timestamp": timestamp_dt
+                "timestamp": timestamp
             })
         return prompts
 
 def get_all_sessions():
     """Get all chat sessions from the database"""
-    with get_db() as conn:
+    flush_messages()
+    with get_reader() as conn:
         c = conn.cursor()
         
-        c.execute(
-            "SELECT id, created_at, updated_at FROM chat_sessions ORDER BY updated_at DESC"
-        )
+        c.execute(_SQL_SELECT_SESSIONS)
         
         sessions = []
-        for session_id, created_at, last_updated in c.fetchall():
-            # Get the first message to use as a title
-            c.execute(
-                "SELECT content FROM chat_messages WHERE session_id = ? AND role = 'user' ORDER BY created_at LIMIT 1",
-                (session_id,)
-            )
-            first_message = c.fetchone()
-            title = first_message[0][:30] + "..." if first_message and len(first_message[0]) > 30 else "New Chat"
+        for session_id, first_message, created_at, last_updated in c:
+            title = (first_message[:TITLE_LENGTH] + "..." if len(first_message) > TITLE_LENGTH else first_message) if first_message else "New Chat"
             
             sessions.append({
                 "session_id": session_id,
                 "title": title,
-                "created_at": datetime.datetime.fromisoformat(created_at),
-                "last_updated": datetime.datetime.fromisoformat(last_updated)
+                "created_at": created_at,
+                "last_updated": last_updated
             })
         return sessions
 
@@ -248,8 +513,9 @@ def clear_session_history(session_id=None):
     """Clear the chat history for a specific session or the current session"""
     if session_id is None:
         session_id = get_or_create_session()
+    flush_messages()
     
-    with get_db() as conn:
+    with get_writer() as conn:
         c = conn.cursor()
         
         # Delete messages for this session
@@ -258,18 +524,19 @@ def clear_session_history(session_id=None):
         # Delete prompt history for this session
         c.execute("DELETE FROM prompt_history WHERE session_id = ?", (session_id,))
         
-        conn.commit()
+        # Without messages the session has no title until its next user message
+        c.execute("UPDATE chat_sessions SET title = NULL WHERE id = ?", (session_id,))
         
-        # Create a new session ID if clearing the current session
+        # Create a new session in the same transaction if clearing the current session
+        new_session_id = None
         if session_id == st.session_state.get("chat_session_id"):
-            st.session_state.chat_session_id = str(uuid.uuid4())
-            
-            # Create a new session in the database
-            c.execute(
-                "INSERT INTO chat_sessions (id, created_at, updated_at) VALUES (?, ?, ?)",
-                (st.session_state.chat_session_id, datetime.datetime.now().isoformat(), datetime.datetime.now().isoformat())
-            )
-            conn.commit()
+            new_session_id = str(uuid.uuid4())
+            _insert_session(c, new_session_id)
+        
+        conn.commit()
+        
+        if new_session_id:
+            st.session_state.chat_session_id = new_session_id
 
 def switch_session(session_id):
     """Switch to a different chat session"""
@@ -280,7 +547,8 @@ def switch_session(session_id):
 
 def delete_session(session_id):
     """Delete a chat session and all its messages"""
-    with get_db() as conn:
+    flush_messages()
+    with get_writer() as conn:
         c = conn.cursor()
         
         # Delete messages for this session
@@ -293,15 +561,15 @@ def delete_session(session_id):
         c.execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,))
         
         conn.commit()
-        
-        # If we deleted the current session, create a new one
-        if session_id == st.session_state.get("chat_session_id"):
-            st.session_state.pop("chat_session_id", None)
-            get_or_create_session()
+    
+    # If we deleted the current session, create a new one
+    if session_id == st.session_state.get("chat_session_id"):
+        st.session_state.pop("chat_session_id", None)
+        get_or_create_session()
 
 def save_cursor(cursor):
     """Save the cursor value to the database"""
-    with get_db() as conn:
+    with get_writer() as conn:
         c = conn.cursor()
         timestamp = datetime.datetime.now().isoformat()
         
@@ -313,60 +581,18 @@ def save_cursor(cursor):
             if not cursor_str:  # Check if empty after stripping
                 cursor_str = None
         
-        print(f"Attempting to save cursor value: {cursor_str}")
-        
-        # First, ensure the app_settings table exists
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS app_settings (
-                key TEXT PRIMARY KEY,
-                value TEXT,
-                updated_at TEXT NOT NULL
-            )
-        ''')
-        
-        # Check if the cursor already exists
-        c.execute("SELECT value FROM app_settings WHERE key = 'last_cursor'")
-        existing = c.fetchone()
-        
-        if existing:
-            # Update existing cursor
-            c.execute(
-                "UPDATE app_settings SET value = ?, updated_at = ? WHERE key = 'last_cursor'",
-                (cursor_str, timestamp)
-            )
-            print("Updated existing cursor record")
-        else:
-            # Insert new cursor
-            c.execute(
-                "INSERT INTO app_settings (key, value, updated_at) VALUES (?, ?, ?)",
-                ('last_cursor', cursor_str, timestamp)
-            )
-            print("Inserted new cursor record")
+        # Insert or update the cursor in a single statement
+        c.execute(_SQL_UPSERT_CURSOR, (cursor_str, timestamp))
         
         conn.commit()
         
-        # Verify the save
-        c.execute("SELECT value FROM app_settings WHERE key = 'last_cursor'")
-        result = c.fetchone()
-        saved_value = result[0] if result else None
-        print(f"Verified saved cursor value: {saved_value}")
-        
-        return saved_value
+        return cursor_str
 
 def load_cursor():
     """Load the cursor value from the database"""
-    with get_db() as conn:
+    with get_reader() as conn:
         c = conn.cursor()
         
-        # First, ensure the app_settings table exists
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS app_settings (
-                key TEXT PRIMARY KEY,
-                value TEXT,
-                updated_at TEXT NOT NULL
-            )
-        ''')
-        
         c.execute("SELECT value FROM app_settings WHERE key = 'last_cursor'")
         result = c.fetchone()
         
@@ -374,28 +600,28 @@ def load_cursor():
         if result and result[0] and result[0].lower() != 'none':
             cursor_value = str(result[0]).strip()  # Add strip() to remove any whitespace
             if cursor_value:  # Only return if non-empty after stripping
-                print(f"Loaded cursor from database: {cursor_value}")
+                logger.debug("Loaded cursor from database: %s", cursor_value)
                 return cursor_value
         
-        print("No valid cursor found in database")
+        logger.debug("No valid cursor found in database")
         return None
 
 def clear_cursor():
     """Clear the cursor from the database"""
-    with get_db() as conn:
+    with get_writer() as conn:
         c = conn.cursor()
         
         try:
             c.execute("DELETE FROM app_settings WHERE key = 'last_cursor'")
             conn.commit()
-            print("Cursor cleared from database")
+            logger.debug("Cursor cleared from database")
         except Exception as e:
-            print(f"Error clearing cursor: {str(e)}")
+            logger.error("Error clearing cursor: %s", e)
             conn.rollback()
 
 def check_db_structure():
     """Check and print the database structure"""
-    with get_db() as conn:
+    with get_reader() as conn:
         c = conn.cursor()
         
         try:
@@ -403,20 +629,20 @@ def check_db_structure():
             c.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='app_settings'")
             schema = c.fetchone()
             if schema:
-                print("app_settings table schema:", schema[0])
+                logger.debug("app_settings table schema: %s", schema[0])
             else:
-                print("app_settings table does not exist")
+                logger.debug("app_settings table does not exist")
                 
             # Check if the table exists and get any records
             c.execute("SELECT * FROM app_settings WHERE key = 'last_cursor'")
             cursor_record = c.fetchone()
             if cursor_record:
-                print("Current cursor record:", cursor_record)
+                logger.debug("Current cursor record: %s", tuple(cursor_record))
             else:
-                print("No cursor record found")
+                logger.debug("No cursor record found")
                 
         except Exception as e:
-            print(f"Error checking database: {str(e)}")
+            logger.error("Error checking database: %s", e)
 
 def get_total_records_count():
     """Get the total number of records in the vector database"""
@@ -426,9 +652,5 @@ def get_total_records_count():
         collection_info = client.get_collection("prompts")
         return collection_info.points_count
     except Exception as e:
-        print(f"Error getting record count: {e}")
+        logger.error("Error getting record count: %s", e)
         return 0
-
-# Initialize the database when this module is imported
-init_db()
-check_db_structure()
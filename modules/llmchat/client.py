@@ -1,8 +1,11 @@
 """Ollama client configuration module"""
+import httpx
 from ollama import Client
 
-# Initialize Ollama client
-client = Client(host='http://jeffaiserver:11434')
+# Initialize Ollama client. It keeps one pooled keep-alive HTTP connection
+# for the whole process; fail fast on connect, but allow slow generations
+# (e.g. while the server loads a model) before the first token arrives.
+client = Client(host='http://jeffaiserver:11434', timeout=httpx.Timeout(120.0, connect=3.0))
 
 def check_server_status():
     """Check if the Ollama server is available"""
@@ -1,9 +1,12 @@
 """Model management and API interaction module"""
+import logging
 import streamlit as st
 from .client import client
 from . import qdrant
 import json
 
+logger = logging.getLogger(__name__)
+
 SYSTEM_MESSAGE = """You are a Stable Diffusion prompt engineering expert. Your task is to help users create and refine prompts for Stable Diffusion image generation.
 
 Key points:
@@ -15,11 +18,20 @@ Key points:
 
 Always treat user input as a Stable Diffusion prompt that needs refinement."""
 
+# Limits on how much earlier conversation is replayed to the model each turn
+MAX_HISTORY_TURNS = 10
+MAX_HISTORY_CHARS = 24000  # Roughly 6000 tokens
+
+@st.cache_data(ttl=30, show_spinner=False)
+def list_model_names():
+    """List model names on the Ollama server (cached; errors are not cached)"""
+    models = client.list()
+    return [model['model'] for model in models['models']]
+
 def get_available_models():
     """Get list of available models from Ollama"""
     try:
-        models = client.list()
-        return [model['model'] for model in models['models']]
+        return list_model_names()
     except Exception as e:
         st.error(f"Error fetching models: {str(e)}")
         return []
@@ -57,9 +69,26 @@ Prompt: <enhanced prompt>
 Negative Prompt: <negative prompt>
 Parameters: <key parameters>"""
 
-    print(f"\n[DEBUG] Generated CoT Prompt:\n{prompt}\n")
+    logger.debug("Generated CoT Prompt:\n%s", prompt)
     return prompt
 
+def _prepare_messages(messages, max_turns=MAX_HISTORY_TURNS, max_chars=MAX_HISTORY_CHARS):
+    """Keep the system message plus the most recent turns that fit the budget"""
+    system_messages = [msg for msg in messages if msg['role'] == 'system']
+    history = [msg for msg in messages if msg['role'] != 'system'][-2 * max_turns:]
+    
+    # Walk back from the newest message; the latest one is always kept
+    budget = max_chars - sum(len(msg['content']) for msg in system_messages)
+    kept = []
+    for msg in reversed(history):
+        budget -= len(msg['content'])
+        if kept and budget < 0:
+            break
+        kept.append(msg)
+    kept.reverse()
+    
+    return [{'role': msg['role'], 'content': msg['content']} for msg in system_messages + kept]
+
 def chat_with_model(messages, llm_model, sd_model, stream=True):
     """Interact with the selected Ollama model with streaming support"""
     try:
@@ -73,26 +102,39 @@ def chat_with_model(messages, llm_model, sd_model, stream=True):
         # Always treat messages as prompt refinement requests
         if last_user_msg:
             messages[-1]['content'] = create_cot_prompt(last_user_msg['content'], llm_model, sd_model)
-            print(f"\n[DEBUG] Chat messages being sent to LLM:\n{json.dumps(messages, indent=2)}\n")
+            # Serializing the whole conversation is only worth it when debugging
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Chat messages being sent to LLM:\n%s", json.dumps(messages, indent=2))
+        
+        # Only send the system message and the recent part of the conversation
+        request_messages = _prepare_messages(messages)
         
         # Generate response with streaming
         if stream:
             response_stream = client.chat(
                 model=llm_model,
-                messages=[{'role': msg['role'], 'content': msg['content']} for msg in messages],
+                messages=request_messages,
                 stream=True
             )
             return response_stream
         else:
             response = client.chat(
                 model=llm_model,
-                messages=[{'role': msg['role'], 'content': msg['content']} for msg in messages]
+                messages=request_messages
             )
             return response['message']['content']
             
     except Exception as e:
         return f"Error calling Ollama API: {str(e)}"
 
+def stream_response_content(response_stream):
+    """Yield the text of each chunk in a streaming chat response"""
+    for response in response_stream:
+        if 'message' in response and 'content' in response['message']:
+            content = response['message']['content']
+            if content:
+                yield content
+
 def save_refined_prompt(prompt, refined_prompt, model_name):
     """This function is deprecated as we're using the existing civitai_images collection"""
     print("Warning: save_refined_prompt is deprecated. Prompts are stored in civitai_images collection.")
@@ -1,71 +1,84 @@
 """Vector database operations for prompt similarity search using Qdrant"""
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, FieldCondition, MatchValue, Filter
-import os
+from qdrant_client.http.models import (
+    Distance, VectorParams, FieldCondition, MatchValue, Filter, SearchParams, QuantizationSearchParams
+)
 from dotenv import load_dotenv
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from modules.datafetcher.embedding_utils import embed_prompts
+from modules.datafetcher.qdrant_utils import get_client_config
 import json
+import logging
+from functools import lru_cache
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Collection name and vector size
 COLLECTION_NAME = "civitai_images"  # Using the same collection as images
 VECTOR_SIZE = 384  # Using the same size as the image embeddings for consistency
 
-# Initialize sentence transformer for text embeddings
-model = SentenceTransformer("BAAI/bge-small-en-v1.5")
+# Shared client so every chat turn reuses the same connection
+_client = None
 
 def get_qdrant_client():
     """Get a connection to the Qdrant vector database"""
+    global _client
+    if _client is not None:
+        return _client
+    
     try:
-        qdrant_api_key = os.getenv("QDRANT_API_KEY")
-        if not qdrant_api_key:
-            raise ValueError("QDRANT_API_KEY not found in environment variables")
-        
-        qdrant_url = os.getenv("QDRANT_URL")
-        if not qdrant_url:
-            raise ValueError("QDRANT_URL not properly configured")
-        
-        return QdrantClient(
-            url=qdrant_url,
-            api_key=qdrant_api_key
-        )
+        # Same connection settings (gRPC transport included) as the fetcher's client
+        _client = QdrantClient(**get_client_config())
+        return _client
     except Exception as e:
         print(f"Error connecting to Qdrant: {e}")
         return None
 
+@lru_cache(maxsize=32)
+def get_model_filter(model_name):
+    """Build the per-model search filter once and reuse it for every chat turn"""
+    return Filter(
+        must=[
+            FieldCondition(
+                key="model",
+                match=MatchValue(value=model_name)
+            )
+        ]
+    )
+
 def get_similar_prompts(prompt, model_name, k=5):
     """Get similar prompts from the vector database"""
     try:
-        print(f"\n[DEBUG] Searching Qdrant for prompts similar to: '{prompt}' for model: {model_name}")
+        logger.debug("Searching Qdrant for prompts similar to: '%s' for model: %s", prompt, model_name)
         
         client = get_qdrant_client()
         if not client:
             return []
 
-        # Generate embedding for the query prompt
-        query_vector = model.encode(prompt).tolist()
+        # Generate embedding for the query prompt with the fetcher's cached model,
+        # so queries and stored prompts are embedded the same way by one shared instance
+        query_vector = embed_prompts([prompt])[0].tolist()
 
-        # Create proper filter conditions
-        query_filter = Filter(
-            must=[
-                FieldCondition(
-                    key="model",
-                    match=MatchValue(value=model_name)
-                )
-            ]
-        )
+        query_filter = get_model_filter(model_name)
         
-        print(f"[DEBUG] Using filter: {json.dumps(query_filter.dict(), indent=2)}")
+        # Serializing the filter and results is only worth it when debugging
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("Using filter: %s", json.dumps(query_filter.dict(), indent=2))
 
         # Search for similar prompts with model filter
         search_result = client.search(
             collection_name=COLLECTION_NAME,
             query_vector=query_vector,
             limit=k,
-            query_filter=query_filter
+            query_filter=query_filter,
+            # Search the int8 quantized vectors, then rescore the top 2k candidates with the originals
+            search_params=SearchParams(
+                quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)
+            )
         )
 
         # Extract prompts and metadata from search results
@@ -81,8 +94,9 @@ def get_similar_prompts(prompt, model_name, k=5):
                 }
                 similar_prompts.append(prompt_data)
         
-        print(f"[DEBUG] Found {len(similar_prompts)} similar prompts")
-        print("[DEBUG] First result:", json.dumps(similar_prompts[0] if similar_prompts else "None", indent=2))
+        logger.debug("Found %d similar prompts", len(similar_prompts))
+        if debug:
+            logger.debug("First result: %s", json.dumps(similar_prompts[0] if similar_prompts else "None", indent=2))
 
         return similar_prompts
 
@@ -107,7 +121,7 @@ def format_prompt_for_rag(similar_prompts):
         context.append(prompt_text)
     
     formatted_context = "\n".join(context)
-    print(f"\n[DEBUG] RAG Context:\n{formatted_context}\n")
+    logger.debug("RAG Context:\n%s", formatted_context)
     return formatted_context
 
 def add_prompt_to_db(prompt, model_name, metadata=None):
@@ -4,6 +4,7 @@ from modules.db_utils import (
     save_message,
     save_prompt_pair,
     load_chat_history,
+    get_or_create_session,
     clear_session_history,
     get_all_sessions,
     switch_session,
@@ -17,6 +18,9 @@ Your goal is to help users create better prompts for image generation models lik
 Provide specific suggestions to improve clarity, detail, and style in prompts.
 """
 
+# Number of messages loaded from the database at a time
+HISTORY_PAGE_SIZE = 50
+
 def initialize_chat_state():
     """Initialize the chat state in the Streamlit session"""
     if "chat_messages" not in st.session_state:
@@ -26,11 +30,20 @@ def initialize_chat_state():
 
 def load_messages_from_db():
     """Load messages from the database and update session state"""
+    # History is read from the database once per chat session; after that
+    # st.session_state.chat_messages is the source of truth. Switching, clearing
+    # or deleting a session changes its id, so the new session's history is read afresh
+    session_id = get_or_create_session()
+    if st.session_state.get("_history_session_id") == session_id:
+        return
+    
     # Initialize chat state
     initialize_chat_state()
+    _reset_chat_messages()
     
-    # Load chat history from the database
-    db_messages = load_chat_history()
+    # Load the most recent page of chat history from the database
+    db_messages = load_chat_history(limit=HISTORY_PAGE_SIZE)
+    _update_history_paging(db_messages)
     
     # If there are messages in the database, update the session state
     if db_messages:
@@ -42,6 +55,38 @@ def load_messages_from_db():
             {"role": msg["role"], "content": msg["content"]} 
             for msg in db_messages
         ]
+    
+    # Only marked once the read succeeded, so a failed load is retried on the next run
+    st.session_state._history_session_id = session_id
+
+def _reset_chat_messages():
+    """Drop the messages and paging state of the previously shown session"""
+    st.session_state.chat_messages = [msg for msg in st.session_state.chat_messages if msg["role"] == "system"]
+    st.session_state.pop("chat_history_oldest_id", None)
+    st.session_state.pop("chat_history_has_more", None)
+
+def load_older_messages():
+    """Prepend the previous page of chat history to the session state"""
+    oldest_id = st.session_state.get("chat_history_oldest_id")
+    if oldest_id is None:
+        return
+    
+    db_messages = load_chat_history(limit=HISTORY_PAGE_SIZE, before_id=oldest_id)
+    _update_history_paging(db_messages)
+    
+    if db_messages:
+        system_messages = [msg for msg in st.session_state.chat_messages if msg["role"] == "system"]
+        other_messages = [msg for msg in st.session_state.chat_messages if msg["role"] != "system"]
+        st.session_state.chat_messages = system_messages + [
+            {"role": msg["role"], "content": msg["content"]}
+            for msg in db_messages
+        ] + other_messages
+
+def _update_history_paging(db_messages):
+    """Remember where the loaded history starts and whether more is available"""
+    if db_messages:
+        st.session_state.chat_history_oldest_id = db_messages[0]["id"]
+    st.session_state.chat_history_has_more = len(db_messages) == HISTORY_PAGE_SIZE
 
 def save_chat_message(role, content):
     """Save a chat message to the database"""
@@ -1,7 +1,13 @@
 """Chat interface module"""
 import streamlit as st
-from .models import get_available_models, chat_with_model, save_refined_prompt
-from .state import load_messages_from_db, save_chat_message
+from .models import (
+    get_available_models,
+    list_model_names,
+    chat_with_model,
+    stream_response_content,
+    save_refined_prompt
+)
+from .state import load_messages_from_db, load_older_messages, save_chat_message
 
 # Available SD models for prompt styles
 SD_MODELS = ["Illustrious", "Flux.1 D", "Pony"]
@@ -14,6 +20,10 @@ def chat_interface():
     col1, col2 = st.columns(2)
     
     with col1:
+        # The model list is cached for a short while; allow forcing a re-check
+        if st.button("Refresh models", type="tertiary"):
+            list_model_names.clear()
+        
         # LLM Model selector
         models = get_available_models()
         selected_model = st.selectbox(
@@ -32,16 +42,20 @@ def chat_interface():
             key="selected_sd_model"
         )
     
-    # Initialize session state
+    # Initialize session state; the database is only read on the first run
     if "chat_messages" not in st.session_state:
         st.session_state.chat_messages = []
-        load_messages_from_db()
+    load_messages_from_db()
     
     # Create chat container
     chat_container = st.container()
     
     # Display chat messages
     with chat_container:
+        # Older history is only read from the database on request
+        if st.session_state.get("chat_history_has_more"):
+            if st.button("Load earlier messages"):
+                load_older_messages()
         chat_messages_display()
     
     # Chat input
@@ -52,20 +66,21 @@ def chat_interface():
         st.session_state.chat_messages.append({"role": "user", "content": prompt})
         save_chat_message("user", prompt)
         
-        # Get AI response with streaming
+        # Get AI response with streaming; tokens are rendered as they arrive
+        # and joined once at the end
         with st.chat_message("assistant"):
-            message_placeholder = st.empty()
-            full_response = ""
+            response_stream = chat_with_model(st.session_state.chat_messages, selected_model, selected_sd_model)
             
-            # Stream the response
-            for response in chat_with_model(st.session_state.chat_messages, selected_model, selected_sd_model):
-                if 'message' in response and 'content' in response['message']:
-                    content = response['message']['content']
-                    full_response += content
-                    message_placeholder.markdown(full_response + "▌")
+            # chat_with_model returns an error message instead of a stream on failure
+            if isinstance(response_stream, str):
+                st.error(response_stream)
+                return
             
-            # Update final response
-            message_placeholder.markdown(full_response)
+            full_response = st.write_stream(stream_response_content(response_stream))
+        
+        # Nothing to save if the model produced no text
+        if not full_response:
+            return
         
         # Save the complete response
         st.session_state.chat_messages.append({"role": "assistant", "content": full_response})
@@ -0,0 +1,63 @@
+"""Prompt embedding cache for the fetch scripts, kept in its own SQLite file"""
+import os
+import sqlite3
+import threading
+from modules.db_utils import DB_DIR
+
+# Separate from app.db so the chat database carries no fetcher-only tables
+CACHE_DB_PATH = os.path.join(DB_DIR, "embedding_cache.db")
+
+# Prompt hashes looked up per query
+EMBEDDING_LOOKUP_CHUNK = 500
+
+# One connection per process; Streamlit reruns use different threads, so access is serialized
+_conn = None
+_lock = threading.Lock()
+
+def _get_connection():
+    """Open the cache database on first use and create its table (caller holds _lock)"""
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(CACHE_DB_PATH, timeout=20, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL; a lost entry is just encoded again
+        # Prompt embeddings keyed by a hash of the prompt text, so a repeated
+        # prompt is never encoded twice, even across restarts
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                model TEXT NOT NULL,
+                key BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, key)
+            ) WITHOUT ROWID
+        ''')
+        conn.commit()
+        _conn = conn
+    return _conn
+
+def load_embeddings(model, keys):
+    """Look up cached embeddings for prompt hashes; returns {key: vector bytes} for the hits"""
+    keys = list(keys)
+    found = {}
+    with _lock:
+        c = _get_connection().cursor()
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(keys), EMBEDDING_LOOKUP_CHUNK):
+            chunk = keys[start:start + EMBEDDING_LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            c.execute(
+                f"SELECT key, vector FROM embedding_cache WHERE model = ? AND key IN ({placeholders})",
+                (model, *chunk)
+            )
+            found.update(c.fetchall())
+    return found
+
+def save_embeddings(model, vectors):
+    """Store (key, vector bytes) pairs in the embedding cache"""
+    with _lock:
+        conn = _get_connection()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embedding_cache (model, key, vector) VALUES (?, ?, ?)",
+            [(model, key, vector) for key, vector in vectors]
+        )
+        conn.commit()
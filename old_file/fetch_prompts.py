@@ -1,14 +1,26 @@
 # Import statements
 import os
 import json
+import hashlib
+import sys
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import streamlit as st
-import pandas as pd
 from dotenv import load_dotenv
-from qdrant_client import QdrantClient
 from qdrant_client.http import models as rest
-from sentence_transformers import SentenceTransformer
-from db_utils import save_cursor, load_cursor, clear_cursor
+
+# Shared helpers live in the repo's modules package, one level above this script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.datafetcher import embedding_utils
+from modules.datafetcher.fetcher import prefetch
+from modules.datafetcher.qdrant_utils import (
+    ensure_collection, get_qdrant_client, pause_indexing, resume_indexing, restore_indexing
+)
+from modules.db_utils import save_cursor, load_cursor, clear_cursor
+from embedding_cache import load_embeddings, save_embeddings
 
 # Load environment variables
 def load_environment_variables():
@@ -25,22 +37,24 @@ def load_environment_variables():
 
 # Initialize Qdrant client
 def initialize_qdrant_client():
-    _, qdrant_url, qdrant_api_key = load_environment_variables()
-    return QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+    """Get the process-wide Qdrant client shared with the datafetcher module, connecting on first use"""
+    qdrant_client = get_qdrant_client()
+    if qdrant_client is None:
+        raise ValueError("Could not establish connection to Qdrant")
+    return qdrant_client
 
 # API setup
 API_URL = "https://api.civitai.com/v1/images"
 
-# Helper functions
-def get_model():
-    """Get or initialize the SentenceTransformer model"""
-    if st.session_state._model is None:
-        try:
-            st.session_state._model = SentenceTransformer("BAAI/bge-small-en-v1.5")
-        except Exception as e:
-            add_message("error", f"Failed to initialize SentenceTransformer model: {str(e)}")
-    return st.session_state._model
+# Reuse keep-alive connections for every Civitai request, retrying rate limits and server errors
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=8,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+))
 
+# Helper functions
 def add_message(msg_type, msg_text):
     """Add a message to session state, avoiding duplicates"""
     if not any(m[1] == msg_text for m in st.session_state.messages):
@@ -52,8 +66,7 @@ def clear_messages():
 
 # Data processing functions
 def process_item(item):
-    """Process a single item"""
-    qdrant_client = initialize_qdrant_client()
+    """Validate a single item and return its id, prompt and payload, or None if it should be skipped"""
     try:
         # Skip if item is None or missing required fields
         if not item or not isinstance(item, dict) or 'id' not in item:
@@ -62,27 +75,6 @@ def process_item(item):
             
         item_id = item["id"]
         
-        # Check if this item already exists in Qdrant
-        search_result = qdrant_client.scroll(
-            collection_name="civitai_images",
-            scroll_filter=rest.Filter(
-                must=[
-                    rest.FieldCondition(
-                        key="id",
-                        match=rest.MatchValue(
-                            value=item_id
-                        )
-                    )
-                ]
-            ),
-            limit=1
-        )
-        
-        # Skip if already exists
-        if search_result[0]:  # If any results found
-            add_message("info", f"Item {item_id} already exists, skipping")
-            return None
-            
         # Get the meta data safely
         meta = item.get("meta", {})
         if not meta or not isinstance(meta, dict):
@@ -101,35 +93,86 @@ def process_item(item):
             add_message("info", f"Item {item_id} has non-target model {base_model}, skipping")
             return None
             
-        # Generate embedding
-        model = get_model()
-        embedding = model.encode(prompt)
-        
-        # Store in Qdrant
-        qdrant_client.upsert(
-            collection_name="civitai_images",
-            points=[
-                rest.PointStruct(
-                    id=item_id,
-                    vector=embedding.tolist(),
-                    payload={
-                        "id": item_id,
-                        "url": item.get("url", ""),
-                        "baseModel": base_model,
-                        "meta": meta
-                    }
-                )
-            ]
-        )
-        
-        add_message("success", f"Stored item {item_id}")
-        st.session_state.stored_image_ids.add(item_id)
-        return item
+        return {
+            "id": item_id,
+            "prompt": prompt,
+            "payload": {
+                "id": item_id,
+                "url": item.get("url", ""),
+                "baseModel": base_model,
+                "meta": meta
+            }
+        }
             
     except Exception as e:
         add_message("error", f"Error processing item {item.get('id', 'unknown')}: {str(e)}")
         return None
 
+def embed_prompts(prompts):
+    """Embed prompts, encoding only those not already in the on-disk embedding cache"""
+    # Content-addressed: identical prompt text always maps to the same key
+    keys = [hashlib.blake2b(prompt.encode(), digest_size=16).digest() for prompt in prompts]
+    cached = load_embeddings(embedding_utils.MODEL_NAME, keys)
+    vectors = {key: np.frombuffer(vector, dtype=np.float32) for key, vector in cached.items()}
+    
+    # Dict keeps one prompt per key, so duplicates within the batch are encoded once
+    missing = {key: prompt for key, prompt in zip(keys, prompts) if key not in vectors}
+    if missing:
+        # One batched encode instead of a forward pass per prompt
+        encoded = embedding_utils.embed_prompts(list(missing.values()))
+        vectors.update(zip(missing, encoded))
+        save_embeddings(embedding_utils.MODEL_NAME, [(key, vector.tobytes()) for key, vector in zip(missing, encoded)])
+    
+    return [vectors[key] for key in keys]
+
+def store_items(data):
+    """Validate items, embed all their prompts in one batched call and upsert the points together.
+    
+    Returns the number of points stored.
+    """
+    # Items stored earlier (or found at startup) are skipped without asking Qdrant
+    valid_items = [
+        v for v in (process_item(item) for item in data)
+        if v and v["id"] not in st.session_state.stored_image_ids
+    ]
+    if not valid_items:
+        return 0
+    
+    # Check which of the remaining items already exist in Qdrant with a single request
+    qdrant_client = initialize_qdrant_client()
+    existing_ids = {
+        point.id for point in qdrant_client.retrieve(
+            collection_name="civitai_images",
+            ids=[v["id"] for v in valid_items],
+            with_payload=False,
+            with_vectors=False
+        )
+    }
+    if existing_ids:
+        add_message("info", f"Skipping {len(existing_ids)} items that already exist")
+        valid_items = [v for v in valid_items if v["id"] not in existing_ids]
+        if not valid_items:
+            return 0
+    
+    embeddings = np.stack(embed_prompts([v["prompt"] for v in valid_items]))
+    
+    # upload_collection takes the (N, 384) matrix directly, so no PointStruct or per-row list
+    # is built; it splits the upload into batches, retries failed ones and doesn't wait for indexing
+    qdrant_client.upload_collection(
+        collection_name="civitai_images",
+        vectors=embeddings,
+        payload=[v["payload"] for v in valid_items],
+        ids=[v["id"] for v in valid_items],
+        batch_size=128,
+        wait=False
+    )
+    
+    st.session_state.stored_image_ids.update(v["id"] for v in valid_items)
+    # New points make the cached counts stale
+    fetch_collection_stats.clear()
+    fetch_total_records_count.clear()
+    return len(valid_items)
+
 def process_and_save_refined_data(data, output_file="processed_civitai_data.json"):
     """Process the raw data and save relevant information to a new JSON file"""
     # Check if data is valid
@@ -137,40 +180,24 @@ def process_and_save_refined_data(data, output_file="processed_civitai_data.json
         add_message("error", "Invalid data format received")
         return []
         
-    processed_data = []
+    # Hoisted out of the loop: set membership instead of scanning the list per item
+    target_models = frozenset(st.session_state.target_models)
     
-    for item in data:
-        # Skip invalid items
-        if not item or not isinstance(item, dict):
-            continue
-            
-        # Get meta data safely
-        meta = item.get("meta", {})
-        if not meta or not isinstance(meta, dict):
-            continue
-            
-        # Skip items without prompts
-        if not meta.get("prompt"):
-            continue
-            
-        # Get base model safely
-        base_model = meta.get("baseModel", "Unknown")
-        
-        # Skip if not in target models
-        if base_model not in st.session_state.target_models:
-            continue
-            
-        # Ensure item has an ID
-        if "id" not in item:
-            continue
-            
-        processed_item = {
+    # Keep items that have an ID, a dict of meta data with a prompt, and a target base model
+    processed_data = [
+        {
             "id": item["id"],
             "url": item.get("url", ""),
-            "baseModel": base_model,
-            "meta": meta
+            "baseModel": item["meta"].get("baseModel", "Unknown"),
+            "meta": item["meta"]
         }
-        processed_data.append(processed_item)
+        for item in data
+        if isinstance(item, dict)
+        and "id" in item
+        and isinstance(item.get("meta"), dict)
+        and item["meta"].get("prompt")
+        and item["meta"].get("baseModel", "Unknown") in target_models
+    ]
     
     # Save to JSON file (commented out but preserved)
     # with open(output_file, "w", encoding="utf-8") as f:
@@ -209,6 +236,7 @@ def fetch_data(target_count, continue_from_last=False):
     
     # Fetch data
     all_data = []
+    seen_ids = set()
     progress_text = "Fetching images..."
     my_bar = st.progress(0, text=progress_text)
     last_cursor = None
@@ -216,20 +244,26 @@ def fetch_data(target_count, continue_from_last=False):
     while len(all_data) < target_count:
         try:
             status.write(f"Making request with params: {params}")
-            response = requests.get(API_URL, headers=headers, params=params)
+            response = http_session.get(API_URL, headers=headers, params=params)
             
             if response.status_code != 200:
                 status.error(f"API request failed: {response.status_code} - {response.text}")
                 break
                 
-            data = response.json()
+            data = orjson.loads(response.content)
             items = data.get("items", [])
             
             if not items:
                 status.write("No more items to fetch")
                 break
                 
-            all_data.extend(items)
+            # Pages can overlap as reaction counts change; keep the first copy of each id
+            for item in items:
+                item_id = item.get("id") if isinstance(item, dict) else None
+                if item_id is None or item_id in seen_ids:
+                    continue
+                seen_ids.add(item_id)
+                all_data.append(item)
             current_progress = min(len(all_data) / target_count, 1.0)
             my_bar.progress(current_progress, text=f"{progress_text} ({len(all_data)}/{target_count})")
             status.write(f"Fetched {len(items)} items, total: {len(all_data)}")
@@ -282,36 +316,16 @@ def process_and_store(data):
     progress_text = "Processing images..."
     my_bar = st.progress(0, text=progress_text)
     
-    processed = 0
     stored = 0
-    skipped = 0
     errors = 0
     
     try:
-        for idx, item in enumerate(data):
-            try:
-                # Update progress
-                current_progress = idx / total
-                my_bar.progress(current_progress, text=f"{progress_text} ({idx}/{total})")
-                
-                # Process item
-                processed_item = process_item(item)
-                if processed_item:
-                    if store_in_vector_db(processed_item):
-                        stored += 1
-                        status.write(f"✅ Stored: {processed_item.get('name', 'Unnamed')}")
-                    else:
-                        skipped += 1
-                        status.write(f"⏭️ Skipped duplicate: {processed_item.get('name', 'Unnamed')}")
-                
-                processed += 1
-                
-            except Exception as e:
-                errors += 1
-                status.write(f"❌ Error processing item: {str(e)}")
-        
-        # Final progress update
-        my_bar.progress(1.0, text=f"Completed processing {total} images")
+        try:
+            stored = store_items(data)
+        except Exception as e:
+            errors += 1
+            status.write(f"❌ Error storing items: {str(e)}")
+        skipped = total - stored if not errors else 0
         
         # Show summary
         if errors > 0:
@@ -322,16 +336,40 @@ def process_and_store(data):
         status.write("---")
         status.write("### Processing Summary")
         status.write(f"- ✅ Successfully stored: {stored}")
-        status.write(f"- ⏭️ Skipped (duplicates): {skipped}")
+        status.write(f"- ⏭️ Skipped (duplicates or invalid): {skipped}")
         status.write(f"- ❌ Errors: {errors}")
-        status.write(f"- 📊 Total processed: {processed}")
+        status.write(f"- 📊 Total processed: {total}")
         
     except Exception as e:
         status.error(f"Fatal error during processing: {str(e)}")
     
     finally:
         # Update the progress bar one last time
-        my_bar.progress(1.0, text=f"Processed {processed} of {total} images")
+        my_bar.progress(1.0, text=f"Processed {total} images")
+
+def iter_pages(headers, params, target_count):
+    """Yield (items, next_cursor) pages from the Civitai API until target_count items are fetched"""
+    params = dict(params)
+    last_cursor = params.get("cursor")
+    fetched = 0
+    
+    while fetched < target_count:
+        response = http_session.get(API_URL, headers=headers, params=params)
+        if response.status_code != 200:
+            raise RuntimeError(f"API Error: {response.status_code}")
+        
+        data = orjson.loads(response.content)
+        items = data.get("items", [])
+        next_cursor = str(data.get("metadata", {}).get("nextCursor") or "").strip()
+        
+        yield items, next_cursor
+        
+        fetched += len(items)
+        # Stop when the API runs out or hands back the same cursor
+        if not items or not next_cursor or next_cursor == last_cursor:
+            return
+        last_cursor = next_cursor
+        params["cursor"] = next_cursor
 
 def check_new_images(continue_from_last=False):
     """Check for new images and process them"""
@@ -386,94 +424,70 @@ def check_new_images(continue_from_last=False):
             else:
                 details_area.write("No valid cursor, starting new fetch")
         
-        # Fetch data
-        all_data = []
-        last_cursor = None
-        fetch_log = []
-        progress = 0.0
+        # Fetch and process: each page is stored while the worker thread downloads the next one
+        status_text.write("🔄 Fetching and Processing Images")
+        fetched = 0
+        seen_ids = set()
+        process_log = []
+        stored = 0
+        skipped = 0
+        errors = 0
+        paused = False
         
-        while len(all_data) < target_count:
-            try:
-                fetch_log.append(f"Fetching: {len(all_data)}/{target_count} images")
-                response = requests.get(API_URL, headers=headers, params=params)
-                
-                if response.status_code != 200:
-                    fetch_log.append(f"❌ API Error: {response.status_code}")
-                    details_area.write("\n".join(fetch_log[-5:]))  # Show last 5 logs
-                    break
-                
-                data = response.json()
-                items = data.get("items", [])
-                
+        try:
+            # Shared with other sessions: indexing resumes once the last running load finishes
+            pause_indexing()
+            paused = True
+            for items, next_cursor in prefetch(iter_pages(headers, params, target_count)):
                 if not items:
-                    fetch_log.append("No more items available")
-                    details_area.write("\n".join(fetch_log[-5:]))
+                    process_log.append("No more items available")
                     break
                 
-                all_data.extend(items)
-                progress = min(len(all_data) / target_count, 1.0)
-                progress_text.write(f"Progress: {int(progress * 100)}%")
+                fetched += len(items)
+                progress_text.write(f"Progress: {int(min(fetched / target_count, 1.0) * 100)}%")
                 
-                # Handle cursor
-                metadata = data.get("metadata", {})
-                next_cursor = metadata.get("nextCursor")
+                # Pages can overlap as reaction counts change; keep the first copy of each id
+                page = []
+                for item in items:
+                    item_id = item.get("id") if isinstance(item, dict) else None
+                    if item_id is None or item_id in seen_ids:
+                        continue
+                    seen_ids.add(item_id)
+                    page.append(item)
+                skipped += len(items) - len(page)
                 
-                if len(all_data) < target_count and next_cursor:
-                    next_cursor = str(next_cursor).strip()
-                    if next_cursor and next_cursor != last_cursor:
-                        last_cursor = next_cursor
-                        saved_cursor = save_cursor(next_cursor)
-                        if saved_cursor:
-                            st.session_state.last_cursor = saved_cursor
-                            fetch_log.append(f"✓ New cursor: {saved_cursor[:10]}...")
-                            params["cursor"] = saved_cursor
-                        else:
-                            fetch_log.append("❌ Failed to save cursor")
-                            details_area.write("\n".join(fetch_log[-5:]))
-                            break
-                else:
-                    break
-                
-                details_area.write("\n".join(fetch_log[-5:]))  # Show last 5 logs
-                    
-            except Exception as e:
-                fetch_log.append(f"❌ Error: {str(e)}")
-                details_area.write("\n".join(fetch_log[-5:]))
-                break
-        
-        # Processing Phase
-        if all_data:
-            status_text.write("🔄 Processing Images")
-            process_log = []
-            
-            total = len(all_data)
-            processed = 0
-            stored = 0
-            skipped = 0
-            errors = 0
-            
-            for idx, item in enumerate(all_data):
                 try:
-                    progress = idx / total
-                    progress_text.write(f"Progress: {int(progress * 100)}%")
-                    
-                    processed_item = process_item(item)
-                    if processed_item:
-                        if store_in_vector_db(processed_item):
-                            stored += 1
-                            process_log.append(f"✅ Stored: {processed_item.get('name', 'Unnamed')}")
-                        else:
-                            skipped += 1
-                            process_log.append(f"⏭️ Skipped: {processed_item.get('name', 'Unnamed')}")
-                    
-                    processed += 1
-                    details_area.write("\n".join(process_log[-5:]))  # Show last 5 logs
-                    
+                    page_stored = store_items(page)
                 except Exception as e:
+                    # Stop with the cursor still on this page, so "Continue from last" retries it
                     errors += 1
                     process_log.append(f"❌ Error: {str(e)}")
-                    details_area.write("\n".join(process_log[-5:]))
-            
+                    break
+                stored += page_stored
+                skipped += len(page) - page_stored
+                process_log.append(f"✅ Fetched {fetched}/{target_count}, stored {page_stored} from this page")
+                
+                # The page is stored; save the cursor only if another page will be fetched
+                if fetched < target_count and next_cursor:
+                    saved_cursor = save_cursor(next_cursor)
+                    if not saved_cursor:
+                        process_log.append("❌ Failed to save cursor")
+                        break
+                    st.session_state.last_cursor = saved_cursor
+                    process_log.append(f"✓ New cursor: {saved_cursor[:10]}...")
+                
+                details_area.write("\n".join(process_log[-5:]))  # Show last 5 logs
+        except Exception as e:
+            process_log.append(f"❌ Error: {str(e)}")
+        finally:
+            if paused:
+                try:
+                    resume_indexing()
+                except Exception as e:
+                    process_log.append(f"❌ Failed to re-enable indexing: {str(e)}")
+        details_area.write("\n".join(process_log[-5:]))
+        
+        if fetched:
             # Final progress
             progress_text.write("Completed!")
             
@@ -488,7 +502,7 @@ def check_new_images(continue_from_last=False):
                     st.write(f"- ⏭️ Skipped: {skipped}")
                 with col2:
                     st.write("#### Status")
-                    st.write(f"- 📊 Total: {processed}")
+                    st.write(f"- 📊 Total: {fetched}")
                     st.write(f"- ❌ Errors: {errors}")
             
             if errors > 0:
@@ -580,56 +594,51 @@ def fetch_prompts_ui():
 
 def initialize_collection():
     """Initialize Qdrant collection if it doesn't exist"""
-    qdrant_client = initialize_qdrant_client()
     try:
-        collections = qdrant_client.get_collections().collections
-        exists = any(c.name == "civitai_images" for c in collections)
-        
-        if not exists:
-            qdrant_client.create_collection(
-                collection_name="civitai_images",
-                vectors_config=rest.VectorParams(
-                    size=384,  # BGE-small embedding size
-                    distance=rest.Distance.COSINE
-                )
-            )
+        qdrant_client = initialize_qdrant_client()
+        if ensure_collection(qdrant_client):
             add_message("success", "Created Qdrant collection 'civitai_images'")
+        # Retry a resume that failed at the end of an earlier load
+        restore_indexing()
         return True
     except Exception as e:
         add_message("error", f"Failed to initialize Qdrant collection: {str(e)}")
         return False
 
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_collection_stats():
+    """Fetch collection statistics from Qdrant, cached for 30 seconds across reruns"""
+    qdrant_client = initialize_qdrant_client()
+    points_count = qdrant_client.get_collection(collection_name="civitai_images").points_count
+    
+    # Get sample records
+    sample_records = []
+    if points_count > 0:
+        sample_result = qdrant_client.scroll(
+            collection_name="civitai_images",
+            limit=5,
+            with_payload=True,
+            with_vectors=False
+        )
+        sample_records = sample_result[0]
+    
+    return {
+        "total_items": points_count,
+        "sample_records": sample_records
+    }
+
 def get_collection_stats():
     """Get statistics about the Qdrant collection"""
-    qdrant_client = initialize_qdrant_client()
     try:
-        # Get collection info
-        collection_info = qdrant_client.get_collection(collection_name="civitai_images")
-        total_items = collection_info.vectors_count
-        
-        # Get sample records
-        sample_records = []
-        if total_items > 0:
-            sample_result = qdrant_client.scroll(
-                collection_name="civitai_images",
-                limit=5,
-                with_payload=True,
-                with_vectors=False
-            )
-            sample_records = sample_result[0]
-        
-        return {
-            "total_items": total_items,
-            "sample_records": sample_records
-        }
+        return fetch_collection_stats()
     except Exception as e:
         add_message("error", f"Error getting collection stats: {str(e)}")
         return None
 
 def verify_qdrant_connection():
     """Verify connection to Qdrant"""
-    qdrant_client = initialize_qdrant_client()
     try:
+        qdrant_client = initialize_qdrant_client()
         # Try to list collections to verify connection
         qdrant_client.get_collections()
         return True, "Qdrant connection verified"
@@ -638,37 +647,44 @@ def verify_qdrant_connection():
 
 def delete_non_target_models():
     """Delete records from Qdrant that don't match target models"""
-    qdrant_client = initialize_qdrant_client()
     try:
-        # First, get all records
-        results = qdrant_client.scroll(
-            collection_name="civitai_images",
-            limit=1000,  # Get in batches of 1000
-            with_payload=True,
-            with_vectors=False
+        qdrant_client = initialize_qdrant_client()
+        # An empty selection would match every record
+        if not st.session_state.target_models:
+            add_message("warning", "No target models selected, nothing deleted")
+            return 0
+        
+        # Filter server-side on the indexed baseModel field (records without one count as non-target)
+        non_target = rest.Filter(
+            must_not=[
+                rest.FieldCondition(
+                    key="baseModel",
+                    match=rest.MatchAny(any=st.session_state.target_models)
+                )
+            ]
         )
-        
-        records = results[0]
-        points_to_delete = []
-        
-        # Find records to delete
-        for record in records:
-            base_model = record.payload.get("baseModel", "Unknown")
-            # Delete if not in target models (including 'Unknown')
-            if base_model not in st.session_state.target_models:
-                points_to_delete.append(record.id)
+        deleted_count = qdrant_client.count(
+            collection_name="civitai_images",
+            count_filter=non_target,
+            exact=True
+        ).count
         
         # Delete points if any found
-        if points_to_delete:
+        if deleted_count:
             qdrant_client.delete(
                 collection_name="civitai_images",
-                points_selector=rest.PointIdsList(points=points_to_delete)
+                points_selector=rest.FilterSelector(filter=non_target)
             )
-            add_message("success", f"Deleted {len(points_to_delete)} records with non-target models")
+            # The deleted ids aren't known client-side, so drop the cached set and rescan next session
+            load_stored_ids.clear()
+            fetch_collection_stats.clear()
+            fetch_total_records_count.clear()
+            st.session_state.stored_image_ids = set()
+            add_message("success", f"Deleted {deleted_count} records with non-target models")
         else:
             add_message("info", "No non-target model records found to delete")
             
-        return len(points_to_delete)
+        return deleted_count
     except Exception as e:
         add_message("error", f"Error deleting non-target models: {str(e)}")
         return 0
@@ -716,12 +732,34 @@ def display_vector_db_samples():
     except Exception as e:
         st.error(f"Error displaying vector DB samples: {str(e)}")
 
+@st.cache_resource
+def load_stored_ids():
+    """Scroll all point ids in the collection (no payloads or vectors), once per process"""
+    qdrant_client = initialize_qdrant_client()
+    ids = set()
+    offset = None
+    while True:
+        records, offset = qdrant_client.scroll(
+            collection_name="civitai_images",
+            limit=10000,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False
+        )
+        ids.update(record.id for record in records)
+        if offset is None:
+            return ids
+
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_total_records_count():
+    """Fetch the number of points in the collection, cached for 30 seconds across reruns"""
+    qdrant_client = initialize_qdrant_client()
+    return qdrant_client.get_collection(collection_name="civitai_images").points_count
+
 def get_total_records_count():
     """Get the total number of records in the Qdrant database"""
     try:
-        qdrant_client = initialize_qdrant_client()
-        collection_info = qdrant_client.get_collection(collection_name="civitai_images")
-        return collection_info.points_count
+        return fetch_total_records_count()
     except Exception as e:
         st.error(f"Error getting record count: {str(e)}")
         return 0
@@ -736,14 +774,17 @@ def initialize_session_state():
         st.session_state.statistics = None
     if "new_images_estimate" not in st.session_state:
         st.session_state.new_images_estimate = 0
-    if "stored_image_ids" not in st.session_state:
-        st.session_state.stored_image_ids = set()
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "stored_image_ids" not in st.session_state:
+        # Seed from the ids already in Qdrant so the first fetch can skip them locally
+        try:
+            st.session_state.stored_image_ids = set(load_stored_ids())
+        except Exception as e:
+            st.session_state.stored_image_ids = set()
+            add_message("error", f"Failed to load stored ids: {str(e)}")
     if "last_action" not in st.session_state:
         st.session_state.last_action = None
-    if "_model" not in st.session_state:
-        st.session_state._model = None
     if "target_count" not in st.session_state:
         st.session_state.target_count = 200
     if "fetch_mode" not in st.session_state:
@@ -1,12 +1,30 @@
 import os
 import json
+import asyncio
+import hashlib
+import sys
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import streamlit as st
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.http import models as rest
-from sentence_transformers import SentenceTransformer
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+# Shared helpers live in the repo's modules package, one level above this script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.datafetcher import embedding_utils
+from modules.datafetcher.fetcher import prefetch
+from modules.datafetcher.qdrant_utils import (
+    ensure_collection, get_client_config, pause_indexing, resume_indexing, restore_indexing
+)
 
 # Initialize session state
 if "job_status" not in st.session_state:
@@ -19,12 +37,14 @@ if "new_images_estimate" not in st.session_state:
     st.session_state.new_images_estimate = 0
 if "stored_image_ids" not in st.session_state:
     st.session_state.stored_image_ids = set()
+if "stored_ids_synced" not in st.session_state:
+    st.session_state.stored_ids_synced = False
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "messages_seen" not in st.session_state:
+    st.session_state.messages_seen = set()
 if "last_action" not in st.session_state:
     st.session_state.last_action = None
-if "_model" not in st.session_state:
-    st.session_state._model = None
 if "last_cursor" not in st.session_state:
     st.session_state.last_cursor = None
 if "fetch_mode" not in st.session_state:
@@ -44,121 +64,141 @@ if not all([civitai_api_key, qdrant_url, qdrant_api_key]):
 
 # API and database setup
 API_URL = "https://api.civitai.com/v1/images"
-qdrant_client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+UPSERT_BATCH_SIZE = 64  # Points per Qdrant upsert request; a 200-item page becomes 4 requests
+UPSERT_CONCURRENCY = 4  # Upsert requests in flight at once
+EMBEDDING_CACHE_SIZE = 20000  # Cached prompt embeddings (~1.5 KB each)
+
+# Columns pulled out of the raw Civitai items by process_and_save_refined_data
+REACTION_COLUMNS = ["stats.heartCount", "stats.likeCount", "stats.laughCount", "stats.cryCount"]
+REFINED_COLUMNS = [
+    "id", "url", "meta.prompt", "meta.negativePrompt", "meta.baseModel", "stats.commentCount"
+] + REACTION_COLUMNS
+
+# Reuse one keep-alive session for all Civitai requests, retrying rate limits and server errors
+http_session = requests.Session()
+http_session.headers.update({
+    "Authorization": f"Bearer {civitai_api_key}",
+    "Accept-Encoding": "gzip"
+})
+http_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+# Same URL, key and gRPC settings (QDRANT_GRPC_PORT, QDRANT_PREFER_GRPC) as the shared client in qdrant_utils
+qdrant_client = QdrantClient(**get_client_config())
 
 def initialize_collection():
     """Initialize Qdrant collection if it doesn't exist"""
     try:
-        collections = qdrant_client.get_collections().collections
-        exists = any(c.name == "civitai_images" for c in collections)
-        
-        if not exists:
-            qdrant_client.create_collection(
-                collection_name="civitai_images",
-                vectors_config=rest.VectorParams(
-                    size=384,  # BGE-small embedding size
-                    distance=rest.Distance.COSINE
-                )
-            )
+        if ensure_collection_once():
             add_message("success", "Created Qdrant collection: civitai_images")
     except Exception as e:
         add_message("error", f"Failed to initialize Qdrant collection: {str(e)}")
+    
+    # Runs on every rerun, so a resume that failed after a load is retried promptly (no request otherwise)
+    try:
+        restore_indexing()
+    except Exception as e:
+        add_message("error", f"Failed to re-enable Qdrant indexing: {str(e)}")
 
-def get_model():
-    """Get or initialize the SentenceTransformer model"""
-    if st.session_state._model is None:
-        try:
-            st.session_state._model = SentenceTransformer("BAAI/bge-small-en-v1.5")
-        except Exception as e:
-            add_message("error", f"Failed to initialize SentenceTransformer model: {str(e)}")
-    return st.session_state._model
+@st.cache_resource
+def ensure_collection_once():
+    """Create the shared collection and its payload indexes once per process"""
+    return ensure_collection(qdrant_client)
+
+@st.cache_resource
+def get_embedding_cache():
+    """Process-wide LRU of prompt hash -> embedding, shared by all sessions"""
+    return threading.Lock(), OrderedDict()
+
+def embed_prompts(prompts):
+    """Embed prompts, encoding each distinct prompt only once and reusing vectors from earlier runs"""
+    lock, cache = get_embedding_cache()
+    keys = [hashlib.blake2b(prompt.encode(), digest_size=16).digest() for prompt in prompts]
+    
+    vectors = {}
+    missing = {}  # Dict keeps one prompt per hash, so duplicates within the batch are encoded once
+    with lock:
+        for key, prompt in zip(keys, prompts):
+            if key in cache:
+                cache.move_to_end(key)
+                vectors[key] = cache[key]
+            else:
+                missing[key] = prompt
+    
+    if missing:
+        encoded = embedding_utils.embed_prompts(list(missing.values()))
+        vectors.update(zip(missing, encoded))
+        
+        with lock:
+            cache.update(zip(missing, encoded))
+            while len(cache) > EMBEDDING_CACHE_SIZE:
+                cache.popitem(last=False)
+    
+    return np.stack([vectors[key] for key in keys])
 
 def add_message(msg_type, msg_text):
     """Add a message to session state, avoiding duplicates"""
-    if not any(m[1] == msg_text for m in st.session_state.messages):
-        st.session_state.messages.append((msg_type, msg_text))
+    if msg_text in st.session_state.messages_seen:
+        return
+    st.session_state.messages_seen.add(msg_text)
+    st.session_state.messages.append((msg_type, msg_text))
 
 def clear_messages():
     """Clear all messages from session state"""
     st.session_state.messages = []
+    st.session_state.messages_seen = set()
 
-def process_item(item):
-    """Process a single item"""
-    try:
-        # Skip if item is None or missing required fields
-        if not item or not isinstance(item, dict) or 'id' not in item:
-            add_message("warning", "Skipping invalid item (missing ID)")
-            return None
-            
-        item_id = item["id"]
-        
-        # Check if this item already exists in Qdrant
-        search_result = qdrant_client.scroll(
-            collection_name="civitai_images",
-            scroll_filter=rest.Filter(
-                must=[
-                    rest.FieldCondition(
-                        key="id",
-                        match=rest.MatchValue(
-                            value=item_id
-                        )
-                    )
-                ]
-            ),
-            limit=1
-        )
-        
-        # Skip if already exists
-        if search_result[0]:  # If any results found
-            add_message("info", f"Item {item_id} already exists, skipping")
-            return None
-            
-        # Get the meta data safely
-        meta = item.get("meta", {})
-        if not meta or not isinstance(meta, dict):
-            add_message("warning", f"Item {item_id} has invalid meta data, skipping")
-            return None
-            
-        # Check for required fields
-        prompt = meta.get("prompt", "").strip()
-        if not prompt:
-            add_message("warning", f"Item {item_id} has no prompt, skipping")
-            return None
-            
-        # Check for base model
-        base_model = meta.get("baseModel", "Unknown")
-        if base_model not in st.session_state.target_models:
-            add_message("info", f"Item {item_id} has non-target model {base_model}, skipping")
-            return None
-            
-        # Generate embedding
-        model = get_model()
-        embedding = model.encode(prompt)
-        
-        # Store in Qdrant
-        qdrant_client.upsert(
-            collection_name="civitai_images",
-            points=[
-                rest.PointStruct(
-                    id=item_id,
-                    vector=embedding.tolist(),
-                    payload={
-                        "id": item_id,
-                        "url": item.get("url", ""),
-                        "baseModel": base_model,
-                        "meta": meta
-                    }
-                )
-            ]
-        )
+def process_item(item, embedding):
+    """Validate a single refined item and build its Qdrant point from a precomputed embedding"""
+    item_id = item["id"]
+    
+    # Check for required fields
+    prompt = item.get("prompt", "").strip()
+    if not prompt:
+        add_message("warning", f"Item {item_id} has no prompt, skipping")
+        return None
         
-        add_message("success", f"Stored item {item_id}")
-        st.session_state.stored_image_ids.add(item_id)
-        return item
-            
-    except Exception as e:
-        add_message("error", f"Error processing item {item.get('id', 'unknown')}: {str(e)}")
+    # Check for base model
+    base_model = item.get("baseModel", "Unknown")
+    if base_model not in st.session_state.target_models:
+        add_message("info", f"Item {item_id} has non-target model {base_model}, skipping")
         return None
+        
+    # Build the point; process_and_store upserts them in batches.
+    # The id lives on the point itself, so only the refined fields go in the payload.
+    payload = {key: value for key, value in item.items() if key != "id"}
+    return rest.PointStruct(
+        id=item_id,
+        vector=embedding.tolist(),
+        payload=payload
+    )
+
+async def upsert_batches(batches):
+    """Upsert batches concurrently, at most UPSERT_CONCURRENCY at a time.
+    
+    Returns one entry per batch: None on success, or the exception that made it fail.
+    """
+    # The async client is bound to the event loop, so it lives only as long as this asyncio.run call
+    client = AsyncQdrantClient(**get_client_config())
+    semaphore = asyncio.Semaphore(UPSERT_CONCURRENCY)
+    
+    # Retry transient failures with exponential backoff
+    @retry(stop=stop_after_attempt(4), wait=wait_exponential(multiplier=0.5, max=8), reraise=True)
+    async def upsert(batch):
+        async with semaphore:
+            await client.upsert(
+                collection_name="civitai_images",
+                points=batch,
+                wait=False
+            )
+    
+    try:
+        return await asyncio.gather(*(upsert(batch) for batch in batches), return_exceptions=True)
+    finally:
+        await client.close()
 
 def process_and_save_refined_data(data, output_file="processed_civitai_data.json"):
     """Process the raw data and save relevant information to a new JSON file"""
@@ -167,40 +207,31 @@ def process_and_save_refined_data(data, output_file="processed_civitai_data.json
         add_message("error", "Invalid data format received")
         return []
         
-    processed_data = []
+    # Flatten meta/stats into columns so filtering runs as vectorized pandas ops
+    df = pd.json_normalize([item for item in data if item and isinstance(item, dict)], max_level=1)
+    df = df.reindex(columns=REFINED_COLUMNS)
     
-    for item in data:
-        # Skip invalid items
-        if not item or not isinstance(item, dict):
-            continue
-            
-        # Get meta data safely
-        meta = item.get("meta", {})
-        if not meta or not isinstance(meta, dict):
-            continue
-            
-        # Skip items without prompts
-        if not meta.get("prompt"):
-            continue
-            
-        # Get base model safely
-        base_model = meta.get("baseModel", "Unknown")
-        
-        # Skip if not in target models
-        if base_model not in st.session_state.target_models:
-            continue
-            
-        # Ensure item has an ID
-        if "id" not in item:
-            continue
-            
-        processed_item = {
-            "id": item["id"],
-            "url": item.get("url", ""),
-            "baseModel": base_model,
-            "meta": meta
-        }
-        processed_data.append(processed_item)
+    # Skip items without an ID or prompt, and models we don't target
+    df["meta.prompt"] = df["meta.prompt"].where(df["meta.prompt"].map(lambda p: isinstance(p, str)), "")
+    df["meta.baseModel"] = df["meta.baseModel"].fillna("Unknown")
+    df = df[
+        df["id"].notna()
+        & df["meta.prompt"].str.strip().astype(bool)
+        & df["meta.baseModel"].isin(st.session_state.target_models)
+    ]
+    
+    # Keep only the fields that are displayed or searched; the full meta and stats dicts are dropped
+    stats = df[REACTION_COLUMNS + ["stats.commentCount"]].fillna(0).astype("int64")
+    processed = pd.DataFrame({
+        "id": df["id"].astype("int64"),
+        "url": df["url"].fillna(""),
+        "baseModel": df["meta.baseModel"],
+        "prompt": df["meta.prompt"],
+        "negativePrompt": df["meta.negativePrompt"].fillna(""),
+        "reactionCount": stats[REACTION_COLUMNS].sum(axis=1),
+        "commentCount": stats["stats.commentCount"]
+    })
+    processed_data = processed.to_dict(orient="records")
     
     # Save to JSON file (commented out but preserved)
     # with open(output_file, "w", encoding="utf-8") as f:
@@ -208,58 +239,106 @@ def process_and_save_refined_data(data, output_file="processed_civitai_data.json
     
     return processed_data
 
-def process_and_store(data):
-    """Process and store items in Qdrant"""
-    try:
-        # Check if data is valid
-        if not data or not isinstance(data, list):
-            add_message("error", "No valid data to process")
-            return
-            
-        # First, process and save the refined data
-        processed_data = process_and_save_refined_data(data)
+def update_statistics(model_counts):
+    """Store per-model image counts from a Counter of stored base models"""
+    # most_common sorts by count, descending; only the handful of result rows becomes a DataFrame
+    st.session_state.statistics = pd.DataFrame(model_counts.most_common(), columns=["Model", "Image Count"])
+
+def prepare_points(data):
+    """Refine a page, drop items that are already stored and embed the rest.
+    
+    Returns the points to upsert and the refined item behind each point id.
+    """
+    # Check if data is valid
+    if not data or not isinstance(data, list):
+        add_message("error", "No valid data to process")
+        return [], {}
         
-        if not processed_data:
-            add_message("error", "No valid data to process")
-            return
-            
-        # Filter out items we've already processed
-        new_items = [item for item in processed_data if item["id"] not in st.session_state.stored_image_ids]
+    # First, process and save the refined data
+    processed_data = process_and_save_refined_data(data)
+    
+    if not processed_data:
+        add_message("error", "No valid data to process")
+        return [], {}
         
-        if not new_items:
-            add_message("info", "No new items to process")
-            st.session_state.progress = 1.0
-            return
-            
-        add_message("info", f"Processing {len(new_items)} new items")
+    # Filter out items we've already processed
+    new_items = [item for item in processed_data if item["id"] not in st.session_state.stored_image_ids]
+    
+    # Check which of the remaining items already exist in Qdrant with a single request
+    if new_items:
+        existing_ids = {
+            point.id for point in qdrant_client.retrieve(
+                collection_name="civitai_images",
+                ids=[item["id"] for item in new_items],
+                with_payload=False,
+                with_vectors=False
+            )
+        }
+        if existing_ids:
+            add_message("info", f"Skipping {len(existing_ids)} items that already exist")
+            st.session_state.stored_image_ids.update(existing_ids)
+            new_items = [item for item in new_items if item["id"] not in existing_ids]
+    
+    if not new_items:
+        add_message("info", "No new items to process")
+        st.session_state.progress = 1.0
+        return [], {}
         
-        # Process items one by one
-        results = []
-        total = len(new_items)
+    add_message("info", f"Processing {len(new_items)} new items")
+    
+    # Embed all prompts in one batched call instead of one forward pass per item
+    prompts = [item["prompt"].strip() for item in new_items]
+    embeddings = embed_prompts(prompts)
+    
+    # Build points for valid items
+    points = []
+    items_by_id = {}
+    for item, embedding in zip(new_items, embeddings):
+        point = process_item(item, embedding)
+        if point:
+            points.append(point)
+            items_by_id[point.id] = item
+    
+    return points, items_by_id
+
+def upload_batches(batches):
+    """Upsert batches of points concurrently; safe to call from a worker thread"""
+    # No Streamlit calls here: outcomes are reported back to the script thread
+    return asyncio.run(upsert_batches(batches)) if batches else []
+
+def record_upserts(batches, outcomes, items_by_id):
+    """Mark the batches that were upserted as stored and return their refined items"""
+    results = []
+    for batch, error in zip(batches, outcomes):
+        if error is not None:
+            add_message("error", f"Error storing batch of {len(batch)} items: {str(error)}")
+            continue
         
-        for i, item in enumerate(new_items, 1):
-            try:
-                result = process_item(item)
-                if result:
-                    results.append(result)
-                st.session_state.progress = i / total
-                
-            except Exception as e:
-                add_message("error", f"Error processing item {item.get('id', 'unknown')}: {str(e)}")
-                continue
+        st.session_state.stored_image_ids.update(point.id for point in batch)
+        results.extend(items_by_id[point.id] for point in batch)
+    
+    if results:
+        fetch_collection_stats.clear()
+        add_message("success", f"Successfully processed {len(results)} items")
+    else:
+        add_message("warning", "No items were successfully processed")
+    
+    return results
+
+def process_and_store(data):
+    """Process and store items in Qdrant"""
+    try:
+        points, items_by_id = prepare_points(data)
+        if not points:
+            return []
+        
+        # Upsert in concurrent batches instead of one request per point
+        batches = [points[start:start + UPSERT_BATCH_SIZE] for start in range(0, len(points), UPSERT_BATCH_SIZE)]
+        results = record_upserts(batches, upload_batches(batches), items_by_id)
         
         # Update statistics immediately if we have results
         if results:
-            df = pd.DataFrame(results)
-            stats = df.groupby("baseModel").agg({
-                "id": "count"
-            }).reset_index()
-            stats.columns = ["Model", "Image Count"]
-            stats = stats.sort_values("Image Count", ascending=False)
-            st.session_state.statistics = stats
-            add_message("success", f"Successfully processed {len(results)} items")
-        else:
-            add_message("warning", "No items were successfully processed")
+            update_statistics(Counter(r["baseModel"] for r in results))
         
         return results
         
@@ -267,13 +346,9 @@ def process_and_store(data):
         add_message("error", f"Error in process_and_store: {str(e)}")
         raise
 
-def fetch_data(target_count, continue_from_last=False):
-    """Fetch data from Civitai API"""
-    headers = {"Authorization": f"Bearer {civitai_api_key}"}
-    
-    data = []
+def iter_pages(target_count, cursor=None):
+    """Yield (items, next_cursor) pages from the Civitai API until target_count items are fetched"""
     total_fetched = 0
-    cursor = st.session_state.last_cursor if continue_from_last and st.session_state.last_cursor else None
     
     while total_fetched < target_count:
         params = {
@@ -285,41 +360,110 @@ def fetch_data(target_count, continue_from_last=False):
         if cursor:
             params["cursor"] = cursor
             
-        try:
-            response = requests.get(API_URL, headers=headers, params=params)
-            if response.status_code != 200:
-                add_message("error", f"API request failed with status {response.status_code}")
-                break
-                
-            json_data = response.json()
-            items = json_data.get("items", [])
+        response = http_session.get(API_URL, params=params)
+        if response.status_code != 200:
+            raise RuntimeError(f"API request failed with status {response.status_code}")
             
+        json_data = orjson.loads(response.content)
+        items = json_data.get("items", [])
+        cursor = json_data.get("metadata", {}).get("nextCursor")
+        
+        yield items, cursor
+        
+        if not items or not cursor:
+            return
+        total_fetched += len(items)
+
+def fetch_data(target_count, continue_from_last=False):
+    """Fetch data from Civitai API, storing each page as it arrives; returns the number of items stored"""
+    cursor = st.session_state.last_cursor if continue_from_last and st.session_state.last_cursor else None
+    
+    seen_ids = set()
+    total_fetched = 0
+    # Only a count per base model is kept across pages, so memory stays bounded by the page size
+    model_counts = Counter()
+    
+    # Three-stage pipeline: the prefetch thread downloads page K+2 and the upload thread
+    # upserts page K while this thread embeds page K+1
+    upload_executor = ThreadPoolExecutor(max_workers=1)
+    pending = None
+    paused = False
+    # Once a batch fails, later cursors would skip its items, so the saved cursor stops advancing
+    cursor_intact = True
+    
+    def commit_cursor(page_cursor):
+        """Save the cursor that resumes after a stored page"""
+        if cursor_intact:
+            st.session_state.last_cursor = page_cursor
+    
+    def finish_upload():
+        """Wait for the in-flight upload, record which of its batches were stored and save its cursor"""
+        nonlocal cursor_intact
+        future, batches, items_by_id, page_cursor = pending
+        try:
+            outcomes = future.result()
+        except Exception as e:
+            outcomes = [e] * len(batches)
+        model_counts.update(r["baseModel"] for r in record_upserts(batches, outcomes, items_by_id))
+        # The running Counter is updated per page, so the table always covers the whole run so far
+        if model_counts:
+            update_statistics(model_counts)
+        if any(error is not None for error in outcomes):
+            cursor_intact = False
+        commit_cursor(page_cursor)
+    
+    try:
+        # Indexing is only paused for the bulk load itself; the collection keeps its HNSW settings
+        pause_indexing()
+        paused = True
+        for items, cursor in prefetch(iter_pages(target_count, cursor)):
             if not items:
                 add_message("info", "No more items available from API")
                 break
                 
+            page = []
             for item in items:
-                if item and isinstance(item, dict) and item not in data:  # Avoid duplicates in the current batch
-                    data.append(item)
-                    total_fetched += 1
-                    
-            st.session_state.progress = total_fetched / target_count
+                if not item or not isinstance(item, dict):
+                    continue
+                # Avoid duplicates across pages of the current run
+                if item.get("id") in seen_ids:
+                    continue
+                seen_ids.add(item.get("id"))
+                page.append(item)
+                
+            total_fetched += len(page)
             add_message("info", f"Fetched {total_fetched} of {target_count} images")
             
-            metadata = json_data.get("metadata", {})
-            cursor = metadata.get("nextCursor")
-            
-            # Save the cursor for next time
-            st.session_state.last_cursor = cursor
+            # Embed this page while the previous one is still uploading
+            points, items_by_id = prepare_points(page)
+            if pending:
+                finish_upload()
+                pending = None
+            if points:
+                batches = [points[start:start + UPSERT_BATCH_SIZE] for start in range(0, len(points), UPSERT_BATCH_SIZE)]
+                pending = (upload_executor.submit(upload_batches, batches), batches, items_by_id, cursor)
+            else:
+                # Nothing to upload, so the page is done
+                commit_cursor(cursor)
+            st.session_state.progress = min(total_fetched / target_count, 1.0)
             
             if not cursor:
                 add_message("info", "Reached end of available data")
                 break
-        except Exception as e:
-            add_message("error", f"Error fetching data: {str(e)}")
-            break
+    except Exception as e:
+        add_message("error", f"Error fetching data: {str(e)}")
+    finally:
+        # The last page is still uploading; indexing must not resume before it lands
+        if pending:
+            finish_upload()
+        upload_executor.shutdown()
+        if paused:
+            try:
+                resume_indexing()
+            except Exception as e:
+                add_message("error", f"Failed to re-enable Qdrant indexing: {str(e)}")
     
-    return data
+    return sum(model_counts.values())
 
 def save_to_json(data, filename="civitai_data.json"):
     """Save the fetched data to a JSON file"""
@@ -327,59 +471,92 @@ def save_to_json(data, filename="civitai_data.json"):
     #     json.dump(data, f, ensure_ascii=False, indent=4)
 
 def check_new_images(target_count):
-    headers = {"Authorization": f"Bearer {civitai_api_key}"}  
     params = {"limit": 1}  
-    response = requests.get(API_URL, headers=headers, params=params)
+    response = http_session.get(API_URL, params=params)
     if response.status_code == 200:
-        total_items = response.json().get("metadata", {}).get("totalItems", 0)
+        total_items = orjson.loads(response.content).get("metadata", {}).get("totalItems", 0)
         new_estimate = max(0, total_items - len(st.session_state.stored_image_ids))
         st.session_state.new_images_estimate = min(new_estimate, target_count)
     else:
         st.session_state.new_images_estimate = "Unable to estimate"
 
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_collection_stats():
+    """Fetch collection statistics from Qdrant, cached for 30 seconds across reruns"""
+    collection_info = qdrant_client.get_collection("civitai_images")
+    points_count = collection_info.points_count
+    
+    # Get sample records if there are any points
+    sample_records = []
+    if points_count > 0:
+        # Try to get up to 5 records
+        results = qdrant_client.scroll(
+            collection_name="civitai_images",
+            limit=5,
+            with_payload=True,
+            with_vectors=False
+        )
+        sample_records = results[0] if results else []
+    
+    return {
+        "total_items": points_count,
+        "sample_records": sample_records
+    }
+
 def get_collection_stats():
     """Get statistics about the Qdrant collection"""
     try:
-        collection_info = qdrant_client.get_collection("civitai_images")
-        points_count = collection_info.points_count
-        
-        # Get sample records if there are any points
-        sample_records = []
-        if points_count > 0:
-            # Try to get up to 5 records
-            results = qdrant_client.scroll(
-                collection_name="civitai_images",
-                limit=5,
-                with_payload=True,
-                with_vectors=False
-            )
-            sample_records = results[0] if results else []
-        
-        return {
-            "total_items": points_count,
-            "sample_records": sample_records
-        }
+        return fetch_collection_stats()
     except Exception as e:
         add_message("error", f"Failed to get collection stats: {str(e)}")
         return None
 
-def verify_qdrant_connection():
-    """Verify Qdrant connection and collection status"""
-    try:
-        # Check if we can connect to Qdrant
-        qdrant_client.get_collections()
-        
-        # Try to get collection info
-        collection = qdrant_client.get_collection("civitai_images")
-        
-        # Try to perform a simple search
-        results = qdrant_client.scroll(
+@st.cache_resource
+def load_stored_ids():
+    """Scroll all point ids in the collection (no payloads or vectors), once per process"""
+    ids = set()
+    offset = None
+    while True:
+        records, offset = qdrant_client.scroll(
             collection_name="civitai_images",
-            limit=1,
-            with_payload=True,
+            limit=10000,
+            offset=offset,
+            with_payload=False,
             with_vectors=False
         )
-        
+        ids.update(record.id for record in records)
+        if offset is None:
+            return ids
+
+@st.cache_data(ttl=3600, max_entries=256)
+def fetch_thumb(url):
+    """Download a sample image once and reuse the bytes across reruns"""
+    response = requests.get(url, timeout=5)
+    response.raise_for_status()
+    return response.content
+
+@st.cache_resource
+def check_qdrant_connection():
+    """Run the Qdrant connectivity checks once per process; raises on failure so it is retried"""
+    # Check if we can connect to Qdrant
+    qdrant_client.get_collections()
+    
+    # Try to get collection info
+    qdrant_client.get_collection("civitai_images")
+    
+    # Try to perform a simple search
+    qdrant_client.scroll(
+        collection_name="civitai_images",
+        limit=1,
+        with_payload=True,
+        with_vectors=False
+    )
+    return True
+
+def verify_qdrant_connection():
+    """Verify Qdrant connection and collection status"""
+    try:
+        check_qdrant_connection()
         return True, "Qdrant connection and collection verified"
     except Exception as e:
         return False, f"Qdrant verification failed: {str(e)}"
@@ -387,34 +564,42 @@ def verify_qdrant_connection():
 def delete_non_target_models():
     """Delete records from Qdrant that don't match target models"""
     try:
-        # First, get all records
-        results = qdrant_client.scroll(
-            collection_name="civitai_images",
-            limit=1000,  # Get in batches of 1000
-            with_payload=True,
-            with_vectors=False
-        )
-        
-        records = results[0]
-        points_to_delete = []
+        # An empty selection would match every record
+        if not st.session_state.target_models:
+            add_message("warning", "No target models selected, nothing deleted")
+            return 0
         
-        # Find records to delete
-        for record in records:
-            base_model = record.payload.get("baseModel", "Unknown")
-            if base_model not in st.session_state.target_models:
-                points_to_delete.append(record.id)
+        # Filter server-side on the indexed baseModel field instead of scrolling records into Python
+        non_target = rest.Filter(
+            must_not=[
+                rest.FieldCondition(
+                    key="baseModel",
+                    match=rest.MatchAny(any=st.session_state.target_models)
+                )
+            ]
+        )
+        deleted_count = qdrant_client.count(
+            collection_name="civitai_images",
+            count_filter=non_target,
+            exact=True
+        ).count
         
         # Delete points if any found
-        if points_to_delete:
+        if deleted_count:
             qdrant_client.delete(
                 collection_name="civitai_images",
-                points_selector=rest.PointIdsList(points=points_to_delete)
+                points_selector=rest.FilterSelector(filter=non_target)
             )
-            add_message("success", f"Deleted {len(points_to_delete)} records with non-target models")
+            fetch_collection_stats.clear()
+            load_stored_ids.clear()
+            # The deleted ids aren't known client-side, so resync the dedup set on the next rerun
+            st.session_state.stored_image_ids = set()
+            st.session_state.stored_ids_synced = False
+            add_message("success", f"Deleted {deleted_count} records with non-target models")
         else:
             add_message("info", "No non-target model records found to delete")
             
-        return len(points_to_delete)
+        return deleted_count
     except Exception as e:
         add_message("error", f"Error deleting non-target models: {str(e)}")
         return 0
@@ -430,6 +615,14 @@ else:
 # Initialize Qdrant collection
 initialize_collection()
 
+# Seed the dedup set from Qdrant once per session so the first run can skip known ids without a request
+if not st.session_state.stored_ids_synced:
+    try:
+        st.session_state.stored_image_ids.update(load_stored_ids())
+        st.session_state.stored_ids_synced = True
+    except Exception as e:
+        add_message("error", f"Failed to load stored ids: {str(e)}")
+
 # Main UI
 st.title("Civitai Data Processor")
 
@@ -491,8 +684,7 @@ with col2:
             st.session_state.last_action = "process"
             try:
                 continue_from_last = st.session_state.fetch_mode == "continue"
-                data = fetch_data(target_count, continue_from_last)
-                process_and_store(data)
+                fetch_data(target_count, continue_from_last)
                 st.session_state.job_status = "Complete"
                 add_message("success", "Processing completed successfully!")
             except Exception as e:
@@ -534,11 +726,16 @@ with col2:
             with st.expander("View Sample Records"):
                 for record in stats['sample_records']:
                     st.write("---")
-                    st.write(f"**ID:** {record.payload['id']}")
+                    # Points stored before the payload was slimmed keep the prompt under meta
+                    prompt = record.payload.get("prompt") or record.payload.get("meta", {}).get("prompt", "")
+                    st.write(f"**ID:** {record.id}")
                     st.write(f"**Base Model:** {record.payload['baseModel']}")
-                    st.write(f"**Prompt:** {record.payload['meta']['prompt'][:200]}...")
+                    st.write(f"**Prompt:** {prompt[:200]}...")
                     if record.payload['url']:
-                        st.image(record.payload['url'], width=200)
+                        try:
+                            st.image(fetch_thumb(record.payload['url']), width=200)
+                        except requests.RequestException:
+                            st.write(record.payload['url'])
         else:
             st.warning("No records found in the database")
             